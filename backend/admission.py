@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from metrics import record_degraded
+
+
+class LatencyBudget:
+    """
+    Per-request deadlines and load shedding for ranking work. A request is
+    shed up front when max_pending requests are already being ranked or
+    waiting for it, and abandoned when its budget runs out; either way the
+    caller serves a cheap fallback instead. A budget of 0 means no
+    deadline and max_pending of 0 means no limit.
+    """
+
+    def __init__(self, budget_ms=0.0, max_pending=0):
+        self.budget_ms = budget_ms
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.counts = {"served": 0, "deadline": 0, "overload": 0}
+
+    def resolve(self, budget_ms=None):
+        """
+        The budget of a request: the client's value, capped by the server
+        budget when there is one.
+        """
+        if budget_ms is None or budget_ms <= 0:
+            return self.budget_ms
+        return min(budget_ms, self.budget_ms) if self.budget_ms > 0 else budget_ms
+
+    def _admit(self):
+        with self.lock:
+            if self.max_pending and self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            return True
+
+    def _release(self, future):
+        with self.lock:
+            self.pending -= 1
+        if not future.cancelled():
+            # Retrieves the error of abandoned work so asyncio does not log it as never retrieved.
+            future.exception()
+
+    def _count(self, result):
+        with self.lock:
+            self.counts[result] += 1
+        if result != "served":
+            record_degraded(result)
+
+    async def run(self, submit, budget_ms=None, withdraw=None):
+        """
+        Starts the work with submit(), which returns a future, and awaits
+        it within the request's budget. Returns (result, None), or
+        (None, reason) with reason "overload" or "deadline". The pending
+        slot is held until the future itself finishes, so work that
+        outlives its deadline still counts against max_pending. On a
+        deadline withdraw(future), when given, may drop work that has not
+        started yet.
+        """
+        if not self._admit():
+            self._count("overload")
+            return None, "overload"
+        future = submit()
+        future.add_done_callback(self._release)
+        budget_ms = self.resolve(budget_ms)
+        try:
+            # Shielded: neither the deadline nor a disconnecting client cancels work that is running.
+            if budget_ms > 0:
+                result = await asyncio.wait_for(asyncio.shield(future), budget_ms / 1000)
+            else:
+                result = await asyncio.shield(future)
+        except asyncio.TimeoutError:
+            if withdraw is not None:
+                withdraw(future)
+            self._count("deadline")
+            return None, "deadline"
+        self._count("served")
+        return result, None
+
+    def stats(self):
+        with self.lock:
+            counts, pending = dict(self.counts), self.pending
+        total = sum(counts.values())
+        return {
+            "budget_ms": self.budget_ms,
+            "max_pending": self.max_pending,
+            "pending": pending,
+            **counts,
+            "degraded_rate": (counts["deadline"] + counts["overload"]) / total if total else 0.0,
+        }
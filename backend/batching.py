@@ -0,0 +1,107 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into batches of up to max_batch_size
+    items, waiting at most max_wait_us after the first item arrives.
+    handler(items) runs in a worker thread and must return one result
+    per item, in order.
+    """
+
+    def __init__(self, handler, max_batch_size=64, max_wait_us=2000):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us / 1_000_000
+        self.queue = None
+        self.worker = None
+        self.running = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.full_batches = 0
+
+    def _ensure_started(self):
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        return await self.enqueue(item)
+
+    def enqueue(self, item):
+        """
+        Queues item and returns the future of its result.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((item, future))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return future
+
+    def withdraw(self, future):
+        """
+        Drops a queued item; an item whose batch is already running is
+        left to finish.
+        """
+        if future not in self.running:
+            future.cancel()
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            if len(batch) == self.max_batch_size:
+                self.full_batches += 1
+
+            self.running = {future for _, future in batch}
+            try:
+                results = await asyncio.to_thread(self.handler, [item for item, _ in batch])
+            except Exception as e:
+                self.running = set()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.running = set()
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_us": int(self.max_wait * 1_000_000),
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": self.requests,
+            "batches": self.batches,
+            "full_batches": self.full_batches,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from pathlib import Path
+from synthetic import SIZES, SYNTHETIC_DIR, SyntheticDataset, read_params
+
+BASE_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BASE_DIR / '../benchmarks'
+
+
+def rss_mb():
+    """
+    Current resident set size; falls back to the peak where /proc is missing.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux.
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def timed(timings, name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    timings[name] = time.perf_counter() - start
+    return result
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def measure(n_requests=1000, batch_size=64, k=5, seed=0):
+    """
+    Loads config.DATA_DIR the way the server does and measures load time
+    per step, memory, and get_recommendations latency and throughput for
+    every ranker. Runs in a fresh process per dataset so memory figures
+    are not polluted by earlier sizes.
+    """
+    from load_data import load_model, load_df, load_recipe_embeddings, load_feasibility_index, load_user_store, load_recipe_records, load_recipe_fragments, load_content_engine
+    from recommendations import TwoTowerRanker, get_recommendations, get_batch_recommendations
+    from retrieval import build_retriever
+    import config
+
+    baseline_rss = rss_mb()
+    load = {}
+    start = time.perf_counter()
+    model = timed(load, "model", load_model)
+    users_df, recipes_df = timed(load, "read_csv", load_df)
+    feasibility_index = timed(load, "feasibility_index", load_feasibility_index, recipes_df)
+    user_store = timed(load, "user_store", load_user_store, users_df, feasibility_index)
+    recipe_records = timed(load, "recipe_records", load_recipe_records, recipes_df)
+    timed(load, "recipe_fragments", load_recipe_fragments, recipes_df)
+    content_engine = timed(load, "content_engine", load_content_engine, recipes_df, feasibility_index)
+    recipe_embeddings = timed(load, "recipe_embeddings", load_recipe_embeddings, model, recipes_df)
+    retriever = timed(load, "retriever", build_retriever, config.RETRIEVAL, recipe_embeddings, feasibility_index,
+                      config.IVF_LISTS, config.IVF_NPROBE, config.EMBEDDING_PRECISION)
+    load["total"] = time.perf_counter() - start
+    loaded_rss = rss_mb()
+
+    del users_df, recipes_df
+    rankers = {"two_tower": TwoTowerRanker(model, retriever), "content_based": content_engine}
+    rng = np.random.default_rng(seed)
+    user_ids = [user_store.user_ids[row] for row in rng.integers(0, len(user_store), n_requests)]
+
+    serving = {}
+    for name, ranker in rankers.items():
+        get_recommendations(user_store, recipe_records, ranker, user_ids[0], k)
+        latencies = []
+        for user_id in user_ids:
+            start = time.perf_counter()
+            get_recommendations(user_store, recipe_records, ranker, user_id, k)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(0, len(user_ids), batch_size):
+            get_batch_recommendations(user_store, recipe_records, ranker, [(user_id, k) for user_id in user_ids[i:i + batch_size]])
+        batch_seconds = time.perf_counter() - start
+
+        serving[name] = {
+            **latency_summary(latencies),
+            "users_per_second": len(latencies) / sum(latencies),
+            "batch_users_per_second": len(user_ids) / batch_seconds,
+        }
+
+    return {
+        "n_users": len(user_store),
+        "n_recipes": len(recipe_records),
+        "n_words": feasibility_index.n_words,
+        "engine": config.ENGINE,
+        "retrieval": config.RETRIEVAL,
+        "embedding_precision": config.EMBEDDING_PRECISION,
+        "quantize_towers": config.QUANTIZE_TOWERS,
+        "load_seconds": load,
+        "memory_mb": {
+            "baseline_rss": baseline_rss,
+            "loaded_rss": loaded_rss,
+            "data_rss": loaded_rss - baseline_rss,
+            "peak_rss": peak_rss_mb(),
+        },
+        "serving": serving,
+        "batch_size": batch_size,
+        "requests": n_requests,
+    }
+
+
+def ensure_dataset(size, data_dir):
+    n_users, n_recipes = SIZES[size]
+    params = read_params(data_dir)
+    if params is not None and (params["n_users"], params["n_recipes"]) == (n_users, n_recipes):
+        return params
+    print(f"Generating {size} dataset ({n_users} users, {n_recipes} recipes) in {data_dir}", flush=True)
+    return SyntheticDataset(n_users, n_recipes).write(data_dir)
+
+
+def run_size(size, data_dir, n_requests, batch_size):
+    env = {**os.environ, "RRS_DATA_DIR": str(data_dir)}
+    command = [sys.executable, str(Path(__file__).resolve()), "measure",
+               "--requests", str(n_requests), "--batch-size", str(batch_size)]
+    output = subprocess.run(command, env=env, cwd=BASE_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=()):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, prefix + (key,))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + (key,), value
+
+
+def compare(report, baseline, threshold=0.2, min_seconds=0.01):
+    """
+    Returns (metric, baseline, current, relative change, regressed) for
+    every timing/memory/throughput metric present in both reports. Load
+    steps shorter than min_seconds in both runs are left out as noise.
+    """
+    previous = dict(flatten(baseline["results"]))
+    rows = []
+    for path, value in flatten(report["results"]):
+        if path not in previous or path[1] not in ("load_seconds", "memory_mb", "serving") or not previous[path]:
+            continue
+        if path[-1] == "baseline_rss" or (path[1] == "load_seconds" and max(value, previous[path]) < min_seconds):
+            continue
+        change = (value - previous[path]) / previous[path]
+        # Throughputs regress when they drop, timings and memory when they grow.
+        worse = -change if path[-1].endswith("per_second") else change
+        rows.append(('.'.join(path), previous[path], value, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading and serving on synthetic datasets.")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="Generate missing datasets and benchmark each size (default)")
+    run_parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    run_parser.add_argument("--data-dir", type=Path, default=SYNTHETIC_DIR)
+    run_parser.add_argument("--out", type=Path, help="Defaults to benchmarks/<timestamp>.json")
+    run_parser.add_argument("--baseline", type=Path, help="Earlier results to compare against")
+    run_parser.add_argument("--threshold", type=float, default=0.2, help="Relative change reported as a regression")
+    run_parser.add_argument("--requests", type=int, default=1000)
+    run_parser.add_argument("--batch-size", type=int, default=64)
+    measure_parser = subparsers.add_parser("measure", help="Benchmark RRS_DATA_DIR in this process, print JSON")
+    measure_parser.add_argument("--requests", type=int, default=1000)
+    measure_parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args(sys.argv[1:] or ["run"])
+
+    if args.command == "measure":
+        print(json.dumps(measure(args.requests, args.batch_size)))
+        return
+
+    report = {
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": {},
+    }
+    for size in args.sizes:
+        data_dir = args.data_dir / size
+        ensure_dataset(size, data_dir)
+        result = run_size(size, data_dir, args.requests, args.batch_size)
+        report["results"][size] = result
+        line = "  ".join(f"{name} p50={r['p50_ms']:.2f}ms p99={r['p99_ms']:.2f}ms {r['batch_users_per_second']:.0f} users/s (batched)"
+                         for name, r in result["serving"].items())
+        print(f"{size:<7} load={result['load_seconds']['total']:.2f}s rss={result['memory_mb']['loaded_rss']:.0f}MB  {line}")
+
+    out = args.out or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.threshold)
+        regressions = [row for row in rows if row[4]]
+        for metric, before, after, change, _ in regressions:
+            print(f"REGRESSION {metric}: {before:.4g} -> {after:.4g} ({change:+.0%})")
+        print(f"{len(regressions)} regressions over {args.threshold:.0%} among {len(rows)} compared metrics")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
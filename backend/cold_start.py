@@ -0,0 +1,83 @@
+import numpy as np
+
+DEFAULT_TASTE = [0.5, 0.5, 0.5, 0.5, 2.5]
+
+
+def weighted_ratings(recipe_idx, ratings, n_recipes, min_votes=3):
+    """
+    Bayesian weighted rating of ColdStartRecommender for every recipe at
+    once: (v / (v+m) * R) + (m / (v+m) * C). Recipes without votes get -inf.
+    """
+    counts = np.bincount(recipe_idx, minlength=n_recipes).astype(np.float64)
+    sums = np.bincount(recipe_idx, weights=ratings, minlength=n_recipes)
+    rated = counts > 0
+    means = np.divide(sums, counts, out=np.zeros(n_recipes), where=rated)
+    global_mean = means[rated].mean() if rated.any() else 0.0
+
+    scores = counts / (counts + min_votes) * means + min_votes / (counts + min_votes) * global_mean
+    return np.where(rated, scores, -np.inf)
+
+
+class ColdStartEngine:
+    """
+    Recommendations for users without a profile. Without preferences it
+    answers from the precomputed weighted-popularity order; with
+    equipment/products/taste it filters by feasibility and ranks by taste
+    distance with the content-based engine. A taste without any equipment
+    or products says nothing about what the visitor can make, so the
+    whole catalog is ranked by taste.
+
+    Scores are on the 0-5 rating scale in both cases.
+    """
+
+    def __init__(self, popularity, content_engine):
+        self.content_engine = content_engine
+        self.feasibility_index = content_engine.feasibility_index
+        self.update_popularity(popularity)
+
+    def update_popularity(self, popularity):
+        popularity = np.asarray(popularity, dtype=np.float64)
+        rated = np.flatnonzero(np.isfinite(popularity))
+        order = rated[np.argsort(-popularity[rated], kind='stable')]
+        # Swapped as one tuple so readers never see scores and order from different updates.
+        self.ranking = (popularity, order)
+
+    @classmethod
+    def from_interactions(cls, recipe_idx, ratings, n_recipes, content_engine, min_votes=3):
+        """
+        recipe_idx holds interned recipe codes, -1 for unknown recipes.
+        """
+        known = recipe_idx >= 0
+        return cls(weighted_ratings(recipe_idx[known], ratings[known], n_recipes, min_votes), content_engine)
+
+    def popular(self, k, feasible=None):
+        popularity, order = self.ranking
+        if feasible is not None:
+            order = order[feasible[order]]
+        top = order[:max(0, k)]
+        return top, popularity[top]
+
+    def recommend(self, equipment=None, products=None, taste=None, k=5):
+        if not equipment and not products and not taste:
+            return self.popular(k)
+
+        user_mask = self.feasibility_index.encode(products or [], equipment or []) if equipment or products else None
+        query = np.array(taste if taste else DEFAULT_TASTE, dtype=np.float64)
+        if len(query) == 4:
+            query = np.append(query, DEFAULT_TASTE[4])
+        # Strength comes on the 1-5 scale, recipe features hold it as 0-1.
+        query[4] /= 5.0
+
+        return self.nearest(query, user_mask, k)
+
+    def nearest(self, features, user_mask=None, k=5):
+        """
+        Recipes closest to taste/strength features in recipe feature
+        units (strength 0-1), among those feasible for user_mask, or the
+        whole catalog without one.
+        """
+        if user_mask is None:
+            user_mask = np.full(self.feasibility_index.n_words, np.iinfo(np.uint64).max, dtype=np.uint64)
+        features = np.asarray(features, dtype=np.float64)
+        top_indices, top_scores = self.content_engine.search_batch(features[None, :], user_mask[None, :], [k])[0]
+        return top_indices, top_scores * 5
@@ -0,0 +1,287 @@
+import argparse
+import fcntl
+import json
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from ranking import top_k_feasible_batch
+from interning import Interner, SortedIds
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def build_interaction_matrix(interactions_df, user_ids, recipe_ids):
+    """
+    Sparse (users x recipes) matrix of mean ratings, missing ratings
+    counted as 2.5 like the notebook prototype. user_ids and recipe_ids
+    are Interners.
+    """
+    return interaction_matrix(user_ids.encode(interactions_df['user_id']), recipe_ids.encode(interactions_df['recipe_id']),
+                              interactions_df['rating'].fillna(2.5).to_numpy(dtype=np.float64),
+                              (len(user_ids), len(recipe_ids)))
+
+
+def rating_totals(user_rows, recipe_idx, ratings, shape):
+    """
+    (sums, counts) CSR matrices of interned interactions; rows with a -1
+    code are left out. Both share the same sparsity pattern.
+    """
+    from scipy import sparse
+
+    known = (user_rows >= 0) & (recipe_idx >= 0)
+    rows, cols, ratings = user_rows[known], recipe_idx[known], ratings[known]
+    sums = sparse.csr_matrix((ratings, (rows, cols)), shape=shape)
+    counts = sparse.csr_matrix((np.ones_like(ratings), (rows, cols)), shape=shape)
+    sums.sum_duplicates()
+    counts.sum_duplicates()
+    return sums, counts
+
+
+def interaction_matrix(user_rows, recipe_idx, ratings, shape):
+    """
+    Mean-rating matrix from interned interactions.
+    """
+    sums, counts = rating_totals(user_rows, recipe_idx, ratings, shape)
+    sums.data /= counts.data
+    return sums
+
+
+def fit_factors(matrix, n_components=20, seed=42):
+    from sklearn.decomposition import TruncatedSVD
+
+    n_components = min(n_components, min(matrix.shape) - 1)
+    svd = TruncatedSVD(n_components=n_components, random_state=seed)
+    user_factors = svd.fit_transform(matrix)
+    return user_factors.astype(np.float32), svd.components_.astype(np.float32)
+
+
+def append_foldin(path, record):
+    """
+    Appends a fold-in record to the log under an exclusive lock, so that
+    workers sharing the log neither interleave lines nor append to a file
+    that read_foldins has just replaced.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(record) + "\n"
+    while True:
+        with open(path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.path.exists(path) and os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                f.write(line)
+                return
+
+
+def read_foldins(path):
+    """
+    The last fold-in record of every user in the log. A log with older
+    records of the same users is rewritten with only these, so replaying
+    it costs one record per folded-in user however many fold-ins came
+    before.
+    """
+    path = Path(path)
+    latest = {}
+    with open(path) as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        n_records = 0
+        for line in f:
+            record = json.loads(line)
+            latest.pop(record["user_id"], None)
+            latest[record["user_id"]] = record
+            n_records += 1
+        if n_records > len(latest):
+            tmp_path = path.with_name(path.name + '.tmp')
+            with open(tmp_path, 'w') as out:
+                out.writelines(json.dumps(record) + "\n" for record in latest.values())
+            os.replace(tmp_path, path)
+    return list(latest.values())
+
+
+class CollaborativeEngine:
+    """
+    Serves TruncatedSVD factors fitted offline. Predicted ratings are
+    user_factors @ item_factors, ranked through the same feasibility and
+    top-k path as the other rankers. A user's factors can be refreshed
+    without refitting by folding in: their rating history plus the new
+    interactions is projected on the item factors, which reproduces the
+    fitted factors for an unchanged history. Each fold-in appends the
+    user's resulting history to foldin_log, and loading replays the last
+    entry of every user, so the log is compacted to one line per user
+    whenever it holds more.
+
+    Users without interactions have no factors and are ranked by the
+    fallback ranker instead.
+    """
+
+    def __init__(self, user_ids, user_factors, item_factors, recipe_ids, feasibility_index, fallback=None,
+                 history=None, foldin_log=None):
+        self.user_ids = list(user_ids)
+        self.user_factors = np.array(user_factors, dtype=np.float32)
+        self.item_factors = np.ascontiguousarray(item_factors, dtype=np.float32)
+        self.recipe_ids = recipe_ids if isinstance(recipe_ids, (Interner, SortedIds)) else Interner(recipe_ids)
+        self.feasibility_index = feasibility_index
+        self.fallback = fallback
+        self.lock = threading.Lock()
+        # (indptr, recipe indices, rating sums, counts) of the fitted users, CSR-style by row.
+        self.history = history
+        self.folded = {}
+        self.foldin_log = Path(foldin_log) if foldin_log else None
+
+        self.index = {user_id: row for row, user_id in enumerate(self.user_ids)}
+        self.has_factors = np.abs(self.user_factors).sum(axis=1) > 0
+
+    def save(self, path):
+        history = {}
+        if self.history is not None:
+            history = dict(zip(("history_indptr", "history_indices", "history_sums", "history_counts"), self.history))
+        np.savez(path, user_ids=np.array(self.user_ids), user_factors=self.user_factors[:len(self.user_ids)],
+                 item_factors=self.item_factors, recipe_ids=np.array(list(self.recipe_ids)), **history)
+
+    @classmethod
+    def load(cls, path, recipe_ids, feasibility_index, fallback=None, foldin_log=None):
+        """
+        Loads fitted factors and replays the fold-ins recorded in
+        foldin_log on top of them.
+        """
+        with np.load(path) as factors:
+            if factors["recipe_ids"].tolist() != list(recipe_ids):
+                raise ValueError(f"Factors in {path} were fitted on a different recipe catalog")
+            history = None
+            # Factors saved before histories were stored fold in the posted interactions only.
+            if "history_indptr" in factors.files:
+                history = tuple(factors[name] for name in ("history_indptr", "history_indices", "history_sums", "history_counts"))
+            engine = cls(factors["user_ids"].tolist(), factors["user_factors"], factors["item_factors"],
+                         recipe_ids, feasibility_index, fallback, history)
+        if foldin_log is not None and Path(foldin_log).exists():
+            for record in read_foldins(foldin_log):
+                recipe_idx = engine.recipe_ids.encode(record["recipe_ids"])
+                known = recipe_idx >= 0
+                engine._set_history(record["user_id"], recipe_idx[known], np.asarray(record["sums"])[known],
+                                    np.asarray(record["counts"])[known])
+        engine.foldin_log = Path(foldin_log) if foldin_log else None
+        return engine
+
+    def user_history(self, user_id):
+        """
+        (recipe indices, rating sums, counts) the user's factors were
+        computed from; empty for users without interactions.
+        """
+        if user_id in self.folded:
+            return self.folded[user_id]
+        row = self.index.get(user_id)
+        if self.history is None or row is None or row >= len(self.history[0]) - 1:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        indptr, indices, sums, counts = self.history
+        start, end = indptr[row], indptr[row + 1]
+        return indices[start:end], sums[start:end], counts[start:end]
+
+    def _set_history(self, user_id, recipe_idx, sums, counts):
+        """
+        Projects the mean rating row of a history onto the item factors
+        and stores the result as the user's factors. Callers hold
+        self.lock, or own the engine while it is loading.
+        """
+        row_vector = np.zeros(len(self.recipe_ids), dtype=np.float32)
+        row_vector[recipe_idx] = sums / counts
+        factors = self.item_factors @ row_vector
+        self.folded[user_id] = (recipe_idx, sums, counts)
+
+        row = self.index.get(user_id)
+        if row is None:
+            row = len(self.user_ids)
+            if row == len(self.user_factors):
+                # Capacity doubles, so adding users costs amortized O(1) rows copied per user.
+                capacity = max(1024, 2 * row)
+                user_factors = np.zeros((capacity, self.user_factors.shape[1]), dtype=np.float32)
+                user_factors[:row] = self.user_factors
+                has_factors = np.zeros(capacity, dtype=bool)
+                has_factors[:row] = self.has_factors
+                self.user_factors, self.has_factors = user_factors, has_factors
+            # The row is filled in before it is published so concurrent readers never see it empty.
+            self.user_factors[row] = factors
+            self.has_factors[row] = bool(np.abs(factors).sum() > 0)
+            self.user_ids.append(user_id)
+            self.index[user_id] = row
+        else:
+            self.user_factors[row] = factors
+            self.has_factors[row] = bool(np.abs(factors).sum() > 0)
+        return factors
+
+    def fold_in(self, user_id, recipe_ids, ratings):
+        """
+        Adds a user's (recipe_id, rating) interactions to their history,
+        projects the mean rating row onto the item factors and stores the
+        result as that user's factors.
+        """
+        recipe_idx = self.recipe_ids.encode(list(recipe_ids))
+        known = recipe_idx >= 0
+        recipe_idx, ratings = recipe_idx[known], np.asarray(list(ratings), dtype=np.float64)[known]
+        n_recipes = len(self.recipe_ids)
+
+        with self.lock:
+            old_idx, old_sums, old_counts = self.user_history(user_id)
+            all_idx = np.concatenate([old_idx, recipe_idx])
+            sums = np.bincount(all_idx, weights=np.concatenate([old_sums, ratings]), minlength=n_recipes)
+            counts = np.bincount(all_idx, weights=np.concatenate([old_counts, np.ones_like(ratings)]), minlength=n_recipes)
+            touched = np.flatnonzero(counts)
+            factors = self._set_history(user_id, touched, sums[touched], counts[touched])
+
+            if self.foldin_log is not None:
+                append_foldin(self.foldin_log, {
+                    "user_id": user_id,
+                    "recipe_ids": [str(self.recipe_ids[int(i)]) for i in touched],
+                    "sums": sums[touched].tolist(),
+                    "counts": counts[touched].tolist(),
+                })
+        return factors
+
+    def scores(self, user_ids):
+        rows = np.array([self.index.get(user_id, -1) for user_id in user_ids])
+        known = rows >= 0
+        known[known] = self.has_factors[rows[known]]
+        scores = np.zeros((len(user_ids), len(self.recipe_ids)), dtype=np.float32)
+        scores[known] = self.user_factors[rows[known]] @ self.item_factors
+        return scores, known
+
+    def rank(self, user_store, rows, ks):
+        user_ids = [user_store.user_ids[row] for row in rows]
+        scores, known = self.scores(user_ids)
+        feasible = self.feasibility_index.feasible_batch(user_store.masks[rows])
+        # Predicted ratings are on the 0-5 scale, responses multiply scores by 5.
+        results = top_k_feasible_batch(scores / 5, feasible, ks)
+
+        if self.fallback is not None and not known.all():
+            cold = np.flatnonzero(~known)
+            for i, result in zip(cold, self.fallback.rank(user_store, np.asarray(rows)[cold], [ks[i] for i in cold])):
+                results[i] = result
+        return results
+
+
+def main():
+    from load_data import load_df, load_interaction_codes
+    import config
+
+    parser = argparse.ArgumentParser(description="Fit collaborative-filtering factors on the interaction logs.")
+    parser.add_argument("--interactions", nargs="+", default=config.INTERACTIONS_PATHS)
+    parser.add_argument("--components", type=int, default=20)
+    parser.add_argument("--out", default=config.CF_FACTORS)
+    args = parser.parse_args()
+
+    users_df, recipes_df = load_df()
+    user_ids = Interner(users_df['user_id'].astype(str))
+    recipe_ids = Interner(recipes_df['recipe_id'].astype(str))
+    user_rows, recipe_idx, ratings = load_interaction_codes(args.interactions, recipe_ids, user_ids)
+    sums, counts = rating_totals(user_rows, recipe_idx, ratings, (len(user_ids), len(recipe_ids)))
+    history = (sums.indptr, sums.indices, sums.data.copy(), counts.data)
+    matrix = sums
+    matrix.data /= counts.data
+    user_factors, item_factors = fit_factors(matrix, args.components)
+    CollaborativeEngine(user_ids, user_factors, item_factors, recipe_ids, feasibility_index=None,
+                        history=history).save(args.out)
+    print(f"Fitted {item_factors.shape[0]} factors on {matrix.nnz} ratings "
+          f"({matrix.shape[0]} users x {matrix.shape[1]} recipes), written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
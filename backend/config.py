@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+def env_flag(name, default=False):
+    return os.environ.get(name, str(int(default))).lower() in ("1", "true", "yes", "on")
+
+
+# Directory with users.csv, recipes.csv and the interactions_*.csv logs.
+DATA_DIR = Path(os.environ.get("RRS_DATA_DIR", BASE_DIR / "../student_data"))
+
+MICROBATCH_ENABLED = env_flag("RRS_MICROBATCH")
+MICROBATCH_MAX_SIZE = int(os.environ.get("RRS_MICROBATCH_MAX_SIZE", 64))
+MICROBATCH_MAX_WAIT_US = int(os.environ.get("RRS_MICROBATCH_MAX_WAIT_US", 2000))
+
+SNAPSHOT_DIR = os.environ.get("RRS_SNAPSHOT_DIR")
+
+# On-disk user store written by disk_user_store.py; when set, users.csv is not loaded into memory.
+USER_STORE_DIR = os.environ.get("RRS_USER_STORE_DIR")
+# Users whose id lookups and decoded profiles are kept in the store's LRU caches.
+USER_CACHE_ROWS = int(os.environ.get("RRS_USER_CACHE_ROWS", 100_000))
+
+# "torch" runs the TwoTowerModel as is, "numpy" serves exported weights without importing torch.
+ENGINE = os.environ.get("RRS_ENGINE", "torch")
+NUMPY_WEIGHTS = Path(os.environ.get("RRS_NUMPY_WEIGHTS", BASE_DIR / "model_weights.npz"))
+
+# "exact" scores every recipe, "ivf" probes the closest k-means lists of an inverted-file index.
+RETRIEVAL = os.environ.get("RRS_RETRIEVAL", "exact")
+IVF_LISTS = int(os.environ.get("RRS_IVF_LISTS", 0))
+IVF_NPROBE = int(os.environ.get("RRS_IVF_NPROBE", 4))
+# Recipe embeddings are stored as "float32", "float16" or "int8" (one scale per row).
+EMBEDDING_PRECISION = os.environ.get("RRS_EMBEDDING_PRECISION", "float32")
+# Run the user and item towers with int8 dynamically quantized linear layers.
+QUANTIZE_TOWERS = env_flag("RRS_QUANTIZE_TOWERS")
+
+# Ranker used when a request does not name one: "two_tower" or "content_based".
+RANKER = os.environ.get("RRS_RANKER", "two_tower")
+
+# Interaction logs used for popularity, separated by os.pathsep.
+INTERACTIONS_PATHS = os.environ.get(
+    "RRS_INTERACTIONS",
+    os.pathsep.join(str(path) for path in sorted(DATA_DIR.glob("interactions_*.csv"))),
+).split(os.pathsep)
+
+# Streaming ingestion keeps popularity up to date from appended interaction records.
+INGEST_ENABLED = env_flag("RRS_INGEST")
+INGEST_PATTERNS = os.environ.get("RRS_INGEST_PATTERNS", str(DATA_DIR / "interactions_*.csv")).split(os.pathsep)
+INGEST_CHECKPOINT = Path(os.environ.get("RRS_INGEST_CHECKPOINT", BASE_DIR / "../checkpoints/ingestion.npz"))
+INGEST_INTERVAL = float(os.environ.get("RRS_INGEST_INTERVAL", 5.0))
+INGEST_CHECKPOINT_INTERVAL = float(os.environ.get("RRS_INGEST_CHECKPOINT_INTERVAL", 60.0))
+
+# Collaborative-filtering factors fitted by collaborative.py; the ranker is enabled when the file exists.
+CF_FACTORS = Path(os.environ.get("RRS_CF_FACTORS", BASE_DIR / "cf_factors.npz"))
+# Fold-ins posted to /users/{id}/interactions, replayed over the factors whenever they are loaded.
+CF_FOLDIN_LOG = Path(os.environ.get("RRS_CF_FOLDIN_LOG", BASE_DIR / "../checkpoints/cf_foldins.jsonl"))
+
+# Materialized top-k table written by materialized.py; served while it matches the model, data and settings.
+TOPK_TABLE_DIR = Path(os.environ.get("RRS_TOPK_TABLE", BASE_DIR / "../topk"))
+
+# Size bound of the in-process cache of per-user rankings in MB; 0 disables it.
+RESULT_CACHE_MB = float(os.environ.get("RRS_RESULT_CACHE_MB", 64))
+
+# Latency budget of a /predict request in ms before it falls back to the popularity
+# list; 0 disables the deadline. Clients can ask for less with ?budget_ms=.
+PREDICT_BUDGET_MS = float(os.environ.get("RRS_PREDICT_BUDGET_MS", 0))
+# /predict requests being ranked or queued beyond which new ones are shed to the fallback; 0 disables shedding.
+PREDICT_MAX_PENDING = int(os.environ.get("RRS_PREDICT_MAX_PENDING", 0))
+
+# Seconds between checks of the model/data files for a hot reload; 0 disables the watcher.
+RELOAD_WATCH_INTERVAL = float(os.environ.get("RRS_RELOAD_WATCH_INTERVAL", 0))
+# When set, /admin endpoints require this value in the X-Admin-Token header.
+ADMIN_TOKEN = os.environ.get("RRS_ADMIN_TOKEN")
+
+# Per-stage timings and counters exposed at /metrics.
+METRICS_ENABLED = env_flag("RRS_METRICS", True)
+# Requests slower than this many milliseconds get their stack samples written to PROFILE_DIR; 0 disables the profiler.
+PROFILE_SLOW_MS = float(os.environ.get("RRS_PROFILE_SLOW_MS", 0))
+PROFILE_INTERVAL_MS = float(os.environ.get("RRS_PROFILE_INTERVAL_MS", 5.0))
+PROFILE_DIR = Path(os.environ.get("RRS_PROFILE_DIR", BASE_DIR / "../profiles"))
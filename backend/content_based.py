@@ -0,0 +1,55 @@
+import numpy as np
+from ranking import top_k_feasible_batch
+from metrics import record_candidates
+
+RECIPE_FEATURES = ['taste_bitterness', 'taste_sweetness', 'taste_acidity', 'taste_body']
+
+
+def recipe_feature_matrix(recipes_df):
+    """
+    Taste columns plus strength normalized to 0-1, as in RecommendsFilter.
+    """
+    return np.column_stack([
+        recipes_df[RECIPE_FEATURES].to_numpy(dtype=np.float32),
+        recipes_df['strength'].to_numpy(dtype=np.float32) / 5.0,
+    ])
+
+
+class ContentBasedEngine:
+    """
+    In-memory content-based ranker: recipes are ordered by Euclidean
+    distance between the user's taste/strength preferences and the recipe
+    profile, restricted to feasible recipes. Distances for a whole batch
+    of users come from one matrix product.
+
+    Scores are 1 - distance / max_distance, so they fall in [0, 1] and
+    higher is better, like the two-tower scores.
+    """
+
+    def __init__(self, recipe_features, feasibility_index):
+        self.recipe_features = np.ascontiguousarray(recipe_features, dtype=np.float64)
+        self.recipe_norms = (self.recipe_features ** 2).sum(axis=1)
+        self.max_distance = np.sqrt(self.recipe_features.shape[1])
+        self.feasibility_index = feasibility_index
+
+    @classmethod
+    def from_recipes(cls, recipes_df, feasibility_index):
+        return cls(recipe_feature_matrix(recipes_df), feasibility_index)
+
+    @staticmethod
+    def user_features(user_store, rows):
+        return np.column_stack([user_store.taste[rows], user_store.strength[rows] / 5.0])
+
+    def distances(self, queries):
+        queries = np.asarray(queries, dtype=np.float64)
+        squared = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ self.recipe_features.T + self.recipe_norms[None, :]
+        return np.sqrt(np.maximum(squared, 0))
+
+    def search_batch(self, queries, user_masks, ks):
+        feasible = self.feasibility_index.feasible_batch(user_masks)
+        scores = 1 - self.distances(queries) / self.max_distance
+        record_candidates("content_based", np.full(len(feasible), feasible.shape[1]), feasible.sum(axis=1))
+        return top_k_feasible_batch(scores, feasible, ks)
+
+    def rank(self, user_store, rows, ks):
+        return self.search_batch(self.user_features(user_store, rows), user_store.masks[rows], ks)
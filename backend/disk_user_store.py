@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from feasibility import FeasibilityIndex
+from recommendations import parse_json_column
+from snapshot import StringTable, JsonTable, file_fingerprint, _encode_json, _save
+from user_store import TASTE_COLUMNS, JSON_COLUMNS
+from interning import SortedIds, sort_ids
+import config
+
+FORMAT_VERSION = 1
+
+
+class NpyWriter:
+    """
+    Appends rows to a raw file and writes the .npy header once the row
+    count is known, so arrays of unknown length are written with bounded
+    memory. close() renames the finished file into place.
+    """
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.rows = 0
+        self.raw_path = Path(f"{path}.raw")
+        self.raw = open(self.raw_path, 'wb')
+
+    def append(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        self.raw.write(array.tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        self.raw.close()
+        tmp_path = Path(f"{self.path}.tmp")
+        header = {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False,
+                  "shape": (self.rows,) + self.row_shape}
+        with open(tmp_path, 'wb') as out, open(self.raw_path, 'rb') as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 1 << 20)
+        os.remove(self.raw_path)
+        os.replace(tmp_path, self.path)
+
+
+class StringTableWriter:
+    """
+    Streaming counterpart of StringTable.write.
+    """
+
+    def __init__(self, path):
+        self.blob = NpyWriter(f"{path}.blob.npy", np.uint8)
+        self.offsets = NpyWriter(f"{path}.offsets.npy", np.int64)
+        self.offsets.append(np.zeros(1, dtype=np.int64))
+        self.size = 0
+
+    def append(self, items):
+        lengths = np.fromiter((len(item) for item in items), dtype=np.int64, count=len(items))
+        self.blob.append(np.frombuffer(b''.join(items), dtype=np.uint8))
+        self.offsets.append(self.size + np.cumsum(lengths))
+        self.size += int(lengths.sum())
+
+    def close(self):
+        self.blob.close()
+        self.offsets.close()
+
+
+_vocab_index = None
+
+
+def _init_encoder(equipment_vocab, product_vocab):
+    global _vocab_index
+    _vocab_index = FeasibilityIndex(equipment_vocab, product_vocab)
+
+
+def _encode_chunk(chunk):
+    """
+    Pre-parses one chunk of users.csv rows the way UserStore.from_users_df
+    does: taste, strength, feasibility masks and JSON profiles.
+    """
+    chunk = chunk.fillna(0)
+    profiles = chunk.to_dict('records')
+    masks = np.zeros((len(profiles), _vocab_index.n_words), dtype=np.uint64)
+    for row, profile in enumerate(profiles):
+        for column in JSON_COLUMNS:
+            profile[column] = parse_json_column(profile[column])
+        masks[row] = _vocab_index.encode(profile['available_products'], profile['owned_equipment'])
+
+    return {
+        "user_ids": [user_id.encode() for user_id in chunk['user_id'].astype(str)],
+        "taste": chunk[TASTE_COLUMNS].to_numpy(dtype=np.float32),
+        "strength": chunk['preferred_strength'].to_numpy(dtype=np.float32),
+        "masks": masks,
+        "profiles": [_encode_json(profile) for profile in profiles],
+    }
+
+
+def import_users(users_path, out_dir, feasibility_index, chunk_size=100_000, workers=1):
+    """
+    Bulk-imports a users.csv into out_dir in chunks, encoding chunks in a
+    process pool with at most two per worker in flight. Only the sorted id
+    index is built in memory at the end: one fixed-width id per user.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    writers = {
+        "taste": NpyWriter(out_dir / 'taste.npy', np.float32, (len(TASTE_COLUMNS),)),
+        "strength": NpyWriter(out_dir / 'strength.npy', np.float32),
+        "masks": NpyWriter(out_dir / 'masks.npy', np.uint64, (feasibility_index.n_words,)),
+    }
+    id_table = StringTableWriter(out_dir / 'user_ids')
+    profile_table = StringTableWriter(out_dir / 'user_profiles')
+    id_chunks = []
+
+    def write(encoded):
+        for name, writer in writers.items():
+            writer.append(encoded[name])
+        id_table.append(encoded["user_ids"])
+        profile_table.append(encoded["profiles"])
+        id_chunks.append(np.array(encoded["user_ids"], dtype=np.bytes_))
+
+    vocab = (feasibility_index.equipment_vocab, feasibility_index.product_vocab)
+    chunks = pd.read_csv(users_path, chunksize=chunk_size)
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_encoder, initargs=vocab) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_encode_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    else:
+        _init_encoder(*vocab)
+        for chunk in chunks:
+            write(_encode_chunk(chunk))
+
+    for writer in writers.values():
+        writer.close()
+    id_table.close()
+    profile_table.close()
+
+    ids = np.concatenate(id_chunks) if id_chunks else np.empty(0, dtype='S1')
+    sorted_ids, sorted_rows = sort_ids(ids)
+    _save(out_dir / 'sorted_ids.npy', sorted_ids)
+    _save(out_dir / 'sorted_rows.npy', sorted_rows)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "sources": {"users": file_fingerprint(users_path)},
+        "n_users": int(len(ids)),
+        "equipment_vocab": feasibility_index.equipment_vocab,
+        "product_vocab": feasibility_index.product_vocab,
+    }
+    with open(out_dir / 'manifest.json.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(out_dir / 'manifest.json.tmp', out_dir / 'manifest.json')
+    return manifest
+
+
+def read_manifest(store_dir):
+    with open(Path(store_dir) / 'manifest.json') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"User store format {manifest.get('format_version')} is not supported, expected {FORMAT_VERSION}")
+    return manifest
+
+
+class _CachedProfiles:
+    def __init__(self, table, max_rows):
+        self.table = table
+        self.get = lru_cache(maxsize=max_rows)(table.__getitem__)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, row):
+        return self.get(int(row))
+
+
+class _CachedLookup:
+    """
+    user_id -> row with an LRU cache of found ids. Unknown ids go to a
+    separate, smaller LRU so that a stream of misses cannot evict the
+    rows of hot users.
+    """
+
+    def __init__(self, user_ids, max_rows, max_misses=10_000):
+        self.user_ids = user_ids
+        self.found = lru_cache(maxsize=max_rows)(self._code)
+        self.missing = OrderedDict()
+        self.max_misses = max_misses
+        self.lock = threading.Lock()
+
+    def _code(self, user_id):
+        row = self.user_ids.code(user_id)
+        if row is None:
+            # lru_cache does not keep calls that raise.
+            raise KeyError(user_id)
+        return row
+
+    def __call__(self, user_id):
+        with self.lock:
+            if user_id in self.missing:
+                self.missing.move_to_end(user_id)
+                return None
+        try:
+            return self.found(user_id)
+        except KeyError:
+            with self.lock:
+                self.missing[user_id] = None
+                if len(self.missing) > self.max_misses:
+                    self.missing.popitem(last=False)
+            return None
+
+    def cache_info(self):
+        return self.found.cache_info()
+
+
+class DiskUserStore:
+    """
+    UserStore over an imported directory: taste, strength and masks are
+    memory-mapped fixed-width records, profiles and ids are memory-mapped
+    string tables, and user_id lookups binary-search a sorted fixed-width
+    id array. Only the pages a request touches are read; LRU caches keep
+    the lookups and decoded profiles of the hottest users, with recent
+    unknown ids cached apart.
+    """
+
+    def __init__(self, store_dir, cache_rows=100_000):
+        store_dir = Path(store_dir)
+        self.manifest = read_manifest(store_dir)
+        self.user_ids = SortedIds(StringTable.open(store_dir / 'user_ids'),
+                                  np.load(store_dir / 'sorted_ids.npy', mmap_mode='r'),
+                                  np.load(store_dir / 'sorted_rows.npy', mmap_mode='r'))
+        self.taste = np.load(store_dir / 'taste.npy', mmap_mode='r')
+        self.strength = np.load(store_dir / 'strength.npy', mmap_mode='r')
+        self.masks = np.load(store_dir / 'masks.npy', mmap_mode='r')
+        self.profiles = _CachedProfiles(JsonTable.open(store_dir / 'user_profiles'), cache_rows)
+        self.lookup = _CachedLookup(self.user_ids, cache_rows)
+
+    @classmethod
+    def open(cls, store_dir, feasibility_index, cache_rows=100_000):
+        """
+        Opens the store after checking that its masks were encoded with
+        the vocabulary of the current recipe catalog.
+        """
+        store = cls(store_dir, cache_rows)
+        vocab = (store.manifest["equipment_vocab"], store.manifest["product_vocab"])
+        if vocab != (feasibility_index.equipment_vocab, feasibility_index.product_vocab):
+            raise ValueError(f"User store {store_dir} was imported against a different recipe catalog, re-run the import")
+        return store
+
+    def __len__(self):
+        return len(self.taste)
+
+    def cache_stats(self):
+        lookups, profiles = self.lookup.cache_info(), self.profiles.get.cache_info()
+        return {
+            "lookup_hits": lookups.hits, "lookup_misses": lookups.misses, "lookup_size": lookups.currsize,
+            "lookup_unknown_size": len(self.lookup.missing),
+            "profile_hits": profiles.hits, "profile_misses": profiles.misses, "profile_size": profiles.currsize,
+        }
+
+
+def main():
+    from load_data import load_recipes_df
+
+    parser = argparse.ArgumentParser(description="Import users.csv into an on-disk user store for RRS_USER_STORE_DIR.")
+    parser.add_argument("--users", type=Path, default=config.DATA_DIR / 'users.csv')
+    parser.add_argument("--out", type=Path, default=config.USER_STORE_DIR or Path(__file__).resolve().parent / '../user_store')
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    feasibility_index = FeasibilityIndex.from_recipes(load_recipes_df())
+    manifest = import_users(args.users, args.out, feasibility_index, args.chunk_size, args.workers)
+    print(f"Imported {manifest['n_users']} users from {args.users} into {args.out} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from load_data import load_model, load_df, load_recipe_embeddings, load_feasibility_index, load_user_store, load_content_engine
+from numpy_engine import run_tower
+from ranking import top_k_feasible_batch
+from retrieval import ExactRetriever
+from cold_start import weighted_ratings
+from collaborative import CollaborativeEngine, build_interaction_matrix, fit_factors
+from interning import Interner
+import config
+
+DATA_DIR = config.DATA_DIR
+
+
+class EvaluationData:
+    """
+    Everything the recommenders need, loaded once: user/recipe feature
+    matrices, feasibility masks, the two-tower model and, when a training
+    interactions file is available, per-recipe popularity, per-user
+    rating-weighted history and collaborative-filtering factors.
+    """
+
+    def __init__(self, train_path=None, min_votes=3):
+        users_df, recipes_df = load_df()
+        self.model = load_model()
+        self.feasibility_index = load_feasibility_index(recipes_df)
+        self.user_store = load_user_store(users_df, self.feasibility_index)
+        self.retriever = ExactRetriever(load_recipe_embeddings(self.model, recipes_df), self.feasibility_index)
+        self.content_engine = load_content_engine(recipes_df, self.feasibility_index)
+
+        self.recipe_ids = Interner(recipes_df['recipe_id'].astype(str))
+
+        self.popularity = None
+        self.history = None
+        self.collaborative = None
+        if train_path is not None and Path(train_path).exists():
+            train_df = pd.read_csv(train_path)
+            user_rows, recipe_idx, ratings = self.encode_interactions(train_df)
+            self.popularity = weighted_ratings(recipe_idx, ratings, len(self.recipe_ids), min_votes)
+            self.history = (user_rows, recipe_idx, ratings)
+
+            user_factors, item_factors = fit_factors(
+                build_interaction_matrix(train_df, self.user_store.user_ids, self.recipe_ids))
+            self.collaborative = CollaborativeEngine(self.user_store.user_ids, user_factors, item_factors, self.recipe_ids,
+                                                     self.feasibility_index, fallback=self.content_engine)
+
+    def encode_interactions(self, interactions_df):
+        ratings = interactions_df['rating'].fillna(2.5).to_numpy(dtype=np.float32)
+        user_rows = self.user_store.user_ids.encode(interactions_df['user_id'])
+        recipe_idx = self.recipe_ids.encode(interactions_df['recipe_id'])
+        known = (user_rows >= 0) & (recipe_idx >= 0)
+        return user_rows[known].astype(np.int64), recipe_idx[known].astype(np.int64), ratings[known]
+
+
+def _pad(top, k):
+    recs = np.full((len(top), k), -1, dtype=np.int64)
+    for i, (indices, _) in enumerate(top):
+        recs[i, :len(indices)] = indices
+    return recs
+
+
+def recommend_two_tower(data, rows, k):
+    user_embs = run_tower(data.model.user_mlp, data.user_store.taste[rows])
+    return _pad(data.retriever.search_batch(user_embs, data.user_store.masks[rows], [k] * len(rows)), k)
+
+
+def recommend_content_based(data, rows, k):
+    return _pad(data.content_engine.rank(data.user_store, rows, [k] * len(rows)), k)
+
+
+def recommend_content_history(data, rows, k):
+    """
+    Distance to the rating-weighted profile of the user's training
+    history, excluding seen recipes; users without history fall back to
+    weighted popularity.
+    """
+    user_rows, recipe_idx, ratings = data.history
+    position = np.full(len(data.user_store), -1, dtype=np.int64)
+    position[rows] = np.arange(len(rows))
+    in_shard = position[user_rows] >= 0
+    shard_users, shard_recipes, shard_ratings = position[user_rows[in_shard]], recipe_idx[in_shard], ratings[in_shard]
+
+    recipe_features = data.content_engine.recipe_features
+    weight_sums = np.bincount(shard_users, weights=shard_ratings, minlength=len(rows))
+    profiles = np.zeros((len(rows), recipe_features.shape[1]))
+    np.add.at(profiles, shard_users, shard_ratings[:, None] * recipe_features[shard_recipes])
+    has_history = weight_sums > 0
+    profiles[has_history] /= weight_sums[has_history, None]
+
+    scores = -data.content_engine.distances(profiles)
+    scores[~has_history] = data.popularity[None, :]
+    feasible = data.feasibility_index.feasible_batch(data.user_store.masks[rows])
+    feasible[shard_users, shard_recipes] = False
+    feasible &= np.isfinite(scores)
+    return _pad(top_k_feasible_batch(scores, feasible, [k] * len(rows)), k)
+
+
+def recommend_collaborative(data, rows, k):
+    return _pad(data.collaborative.rank(data.user_store, rows, [k] * len(rows)), k)
+
+
+def recommend_cold_start(data, rows, k):
+    feasible = data.feasibility_index.feasible_batch(data.user_store.masks[rows]) & np.isfinite(data.popularity)
+    scores = np.broadcast_to(data.popularity, feasible.shape)
+    return _pad(top_k_feasible_batch(scores, feasible, [k] * len(rows)), k)
+
+
+RECOMMENDERS = {
+    "two_tower": (recommend_two_tower, False),
+    "content_based": (recommend_content_based, False),
+    "content_history": (recommend_content_history, True),
+    "collaborative": (recommend_collaborative, True),
+    "cold_start": (recommend_cold_start, True),
+}
+
+
+def ranking_metrics(recs, truth, k):
+    """
+    Per-user NDCG@k, recall@k and AP@k for a (users x k) matrix of recipe
+    indices (-1 for padding) against a dense (users x recipes) relevance
+    matrix with rating / 5.0 for every validation interaction.
+    """
+    valid = recs >= 0
+    gains = np.where(valid, np.take_along_axis(truth, np.maximum(recs, 0), axis=1), 0.0)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+
+    dcg = (gains * discounts).sum(axis=1)
+    ideal = -np.sort(-truth, axis=1)[:, :k]
+    idcg = (ideal * discounts[:ideal.shape[1]]).sum(axis=1)
+    ndcg = np.divide(dcg, idcg, out=np.zeros_like(dcg), where=idcg > 0)
+
+    hits = gains > 0
+    n_relevant = (truth > 0).sum(axis=1)
+    recall = np.divide(hits.sum(axis=1), n_relevant, out=np.zeros(len(recs)), where=n_relevant > 0)
+
+    precision_at_i = np.cumsum(hits, axis=1) / np.arange(1, k + 1)
+    ap_norm = np.minimum(n_relevant, k)
+    ap = np.divide((precision_at_i * hits).sum(axis=1), ap_norm, out=np.zeros(len(recs)), where=ap_norm > 0)
+    return ndcg, recall, ap
+
+
+_worker_data = None
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _recommend_shard(name, rows, k):
+    return RECOMMENDERS[name][0](_worker_data, rows, k)
+
+
+def evaluate(data, val_path, recommenders, k=5, workers=1, shard_size=512):
+    val_df = pd.read_csv(val_path)
+    user_rows, recipe_idx, ratings = data.encode_interactions(val_df)
+    rows, inverse = np.unique(user_rows, return_inverse=True)
+    shards = [rows[i:i + shard_size] for i in range(0, len(rows), shard_size)]
+
+    # Relevance is built one shard at a time; a dense users x recipes matrix does not fit at scale.
+    order = np.argsort(inverse, kind='stable')
+    inverse, recipe_idx, ratings = inverse[order], recipe_idx[order], ratings[order]
+    bounds = np.searchsorted(inverse, np.arange(0, len(rows) + shard_size, shard_size))
+
+    def shard_truth(i):
+        start, end = bounds[i], bounds[i + 1]
+        truth = np.zeros((len(shards[i]), len(data.recipe_ids)), dtype=np.float32)
+        truth[inverse[start:end] - i * shard_size, recipe_idx[start:end]] = ratings[start:end] / 5.0
+        return truth
+
+    # Workers inherit data through fork instead of pickling it: it holds locks and is large.
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"), initializer=_init_worker,
+                                   initargs=(data,)) if workers > 1 else None
+    if executor is None:
+        _init_worker(data)
+
+    results = {}
+    try:
+        for name in recommenders:
+            start = time.perf_counter()
+            if executor is None:
+                parts = [_recommend_shard(name, shard, k) for shard in shards]
+            else:
+                parts = list(executor.map(_recommend_shard, [name] * len(shards), shards, [k] * len(shards)))
+            elapsed = time.perf_counter() - start
+
+            metrics = [ranking_metrics(recs, shard_truth(i), k) for i, recs in enumerate(parts)]
+            ndcg, recall, ap = (np.concatenate(values) for values in zip(*metrics)) if metrics else (np.empty(0),) * 3
+            results[name] = {
+                f"ndcg@{k}": float(ndcg.mean()) if len(ndcg) else 0.0,
+                f"recall@{k}": float(recall.mean()) if len(recall) else 0.0,
+                f"map@{k}": float(ap.mean()) if len(ap) else 0.0,
+                "users": int(len(rows)),
+                "seconds": elapsed,
+            }
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate all recommenders on the validation interactions.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--train", default=DATA_DIR / 'interactions_train.csv')
+    parser.add_argument("--val", nargs="+", default=[DATA_DIR / 'interactions_val.csv', DATA_DIR / 'interactions_val_cold.csv'])
+    parser.add_argument("--recommenders", nargs="+", default=list(RECOMMENDERS), choices=list(RECOMMENDERS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    data = EvaluationData(args.train)
+    recommenders = [name for name in args.recommenders if not RECOMMENDERS[name][1] or data.history is not None]
+    skipped = sorted(set(args.recommenders) - set(recommenders))
+    if skipped:
+        print(f"Skipping {', '.join(skipped)}: no training interactions at {args.train}")
+
+    report = {}
+    for val_path in args.val:
+        results = evaluate(data, val_path, recommenders, args.k, args.workers)
+        report[Path(val_path).name] = results
+        print(f"\n{Path(val_path).name}")
+        for name, metrics in results.items():
+            summary = "  ".join(
+                f"{metric}={value:.4f}" if isinstance(value, float) else f"{metric}={value}"
+                for metric, value in metrics.items() if metric != "seconds"
+            )
+            print(f"  {name:<16} {summary}  ({metrics['seconds']:.2f}s)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import ast
+import numpy as np
+
+WORD_BITS = 64
+
+
+def _parse_tokens(data):
+    if isinstance(data, str):
+        try:
+            data = ast.literal_eval(data)
+        except (ValueError, SyntaxError):
+            return []
+    if isinstance(data, dict):
+        return list(data.keys())
+    if isinstance(data, (list, tuple, set)):
+        return list(data)
+    return []
+
+
+class FeasibilityIndex:
+    """
+    Packs recipe requirements into uint64 bitmasks so that availability
+    for the whole catalog is one vectorized check against a user mask.
+    Equipment bits come first, product bits follow.
+    """
+
+    def __init__(self, equipment_vocab, product_vocab, recipe_masks=None):
+        self.equipment_vocab = list(equipment_vocab)
+        self.product_vocab = list(product_vocab)
+        self.equipment_bits = {name: i for i, name in enumerate(self.equipment_vocab)}
+        offset = len(self.equipment_vocab)
+        self.product_bits = {name: offset + i for i, name in enumerate(self.product_vocab)}
+
+        n_bits = len(self.equipment_vocab) + len(self.product_vocab)
+        self.n_words = max(1, -(-n_bits // WORD_BITS))
+        self.recipe_masks = recipe_masks
+
+    @classmethod
+    def from_recipes(cls, recipes_df):
+        recipe_equipment = [_parse_tokens(x) for x in recipes_df['required_equipment']]
+        recipe_products = [_parse_tokens(x) for x in recipes_df['required_products']]
+
+        equipment_vocab = sorted({e for equip in recipe_equipment for e in equip})
+        product_vocab = sorted({p for prods in recipe_products for p in prods})
+
+        index = cls(equipment_vocab, product_vocab)
+        index.recipe_masks = np.zeros((len(recipes_df), index.n_words), dtype=np.uint64)
+        for i, (prods, equip) in enumerate(zip(recipe_products, recipe_equipment)):
+            index.recipe_masks[i] = index.encode(prods, equip)
+        return index
+
+    def encode(self, products, equipment):
+        """
+        Bitmask of a products/equipment pair. Tokens that no recipe
+        requires have no bit and are ignored.
+        """
+        bits = [self.equipment_bits[e] for e in _parse_tokens(equipment) if e in self.equipment_bits]
+        bits += [self.product_bits[p] for p in _parse_tokens(products) if p in self.product_bits]
+
+        mask = np.zeros(self.n_words, dtype=np.uint64)
+        for bit in bits:
+            mask[bit // WORD_BITS] |= np.uint64(1) << np.uint64(bit % WORD_BITS)
+        return mask
+
+    def feasible(self, user_mask):
+        return ((self.recipe_masks & ~user_mask) == 0).all(axis=1)
+
+    def feasible_batch(self, user_masks):
+        return ((self.recipe_masks[None, :, :] & ~user_masks[:, None, :]) == 0).all(axis=2)
@@ -0,0 +1,310 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from interning import Interner
+
+DEFAULT_RATING = 2.5
+
+
+def parse_rating(rating):
+    try:
+        return float(rating)
+    except (TypeError, ValueError):
+        return DEFAULT_RATING
+
+
+class InteractionIngestor:
+    """
+    Tails appended interaction records (interactions_*.csv schema) and
+    keeps running per-recipe rating sums/counts and per-user
+    rating-weighted recipe feature sums in compact arrays, so popularity
+    and taste profiles update incrementally instead of being rebuilt from
+    the whole log. Events are applied in batches: recipe ids are interned
+    with one vectorized lookup and only the touched rows of the arrays are
+    updated with np.add.at, so the cost of a record does not depend on the
+    catalog size.
+
+    State, including how far each file has been read, is checkpointed so
+    a restart resumes from the last checkpoint instead of replaying
+    history. Appended data is read CHUNK_BYTES at a time, so a large
+    backlog on the first poll is not held in memory at once.
+    """
+
+    CHUNK_BYTES = 1 << 20
+
+    def __init__(self, recipe_ids, recipe_features, patterns, min_votes=3, checkpoint_path=None):
+        self.recipe_ids = Interner(recipe_ids)
+        self.recipe_features = np.asarray(recipe_features, dtype=np.float64)
+        self.patterns = list(patterns)
+        self.min_votes = min_votes
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+
+        n_recipes = len(recipe_ids)
+        self.recipe_counts = np.zeros(n_recipes)
+        self.recipe_sums = np.zeros(n_recipes)
+        self.sum_of_means = 0.0
+        self.n_rated = 0
+
+        self.user_index = {}
+        self.user_weights = np.zeros(1024)
+        self.user_sums = np.zeros((1024, self.recipe_features.shape[1]))
+
+        self.offsets = {}
+        self.headers = {}
+        self.events = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def _user_row(self, user_id):
+        row = self.user_index.get(user_id)
+        if row is None:
+            row = len(self.user_index)
+            self.user_index[user_id] = row
+            if row == len(self.user_weights):
+                self.user_weights = np.concatenate([self.user_weights, np.zeros(row)])
+                self.user_sums = np.vstack([self.user_sums, np.zeros_like(self.user_sums)])
+        return row
+
+    def ingest(self, user_id, recipe_id, rating):
+        with self.lock:
+            self.ingest_batch([user_id], [recipe_id], [rating])
+
+    def ingest_batch(self, user_ids, recipe_ids, ratings):
+        """
+        Applies parallel sequences of events; empty or unparsable ratings
+        count as DEFAULT_RATING and unknown recipes are skipped. Only the
+        recipes and users in the batch are touched, and sum_of_means and
+        n_rated move by the change of their means. Callers hold self.lock.
+        """
+        recipes = self.recipe_ids.encode(recipe_ids)
+        known = recipes >= 0
+        self.skipped += int(len(recipes) - known.sum())
+        if not known.any():
+            return
+        recipes = recipes[known]
+        ratings = np.array([parse_rating(rating) for rating in ratings], dtype=np.float64)[known]
+        rows = np.fromiter((self._user_row(user_id) for user_id, keep in zip(user_ids, known) if keep),
+                           dtype=np.int64, count=len(recipes))
+
+        touched = np.unique(recipes)
+        old_counts, old_sums = self.recipe_counts[touched], self.recipe_sums[touched]
+        np.add.at(self.recipe_counts, recipes, 1)
+        np.add.at(self.recipe_sums, recipes, ratings)
+        was_rated = old_counts > 0
+        self.sum_of_means += float((self.recipe_sums[touched] / self.recipe_counts[touched]).sum()
+                                   - (old_sums[was_rated] / old_counts[was_rated]).sum())
+        self.n_rated += int(len(touched) - was_rated.sum())
+
+        np.add.at(self.user_weights, rows, ratings)
+        np.add.at(self.user_sums, rows, ratings[:, None] * self.recipe_features[recipes])
+        self.events += len(recipes)
+
+    def popularity(self):
+        with self.lock:
+            counts, sums = self.recipe_counts.copy(), self.recipe_sums.copy()
+            global_mean = self.sum_of_means / self.n_rated if self.n_rated else 0.0
+        rated = counts > 0
+        means = np.divide(sums, counts, out=np.zeros_like(sums), where=rated)
+        scores = counts / (counts + self.min_votes) * means + self.min_votes / (counts + self.min_votes) * global_mean
+        return np.where(rated, scores, -np.inf)
+
+    def user_profile(self, user_id):
+        """
+        Rating-weighted mean recipe features of the user's ingested
+        interactions, or None for users without any.
+        """
+        with self.lock:
+            row = self.user_index.get(user_id)
+            if row is None or self.user_weights[row] == 0:
+                return None
+            return self.user_sums[row] / self.user_weights[row]
+
+    def _read_new_lines(self, path):
+        """
+        Yields (lines, offset) for the complete lines appended to path
+        since the last poll, CHUNK_BYTES at a time; offset is where the
+        chunk ends. A partially written last record is left for the next
+        poll.
+        """
+        offset = self.offsets.get(path, 0)
+        size = os.path.getsize(path)
+        if size < offset:
+            # The file was truncated or replaced, read it again from the start.
+            offset = 0
+            self.headers.pop(path, None)
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            pending = b''
+            while offset + len(pending) < size:
+                data = pending + f.read(min(self.CHUNK_BYTES, size - offset - len(pending)))
+                end = data.rfind(b'\n') + 1
+                pending = data[end:]
+                if end:
+                    offset += end
+                    yield data[:end].decode().splitlines(), offset
+
+    def poll(self):
+        """
+        Reads everything appended since the last poll. Returns the number
+        of ingested events.
+        """
+        before = self.events
+        paths = sorted({path for pattern in self.patterns for path in glob.glob(str(pattern))})
+        for path in paths:
+            for lines, offset in self._read_new_lines(path):
+                rows = csv.reader(lines)
+                if path not in self.headers:
+                    self.headers[path] = next(rows)
+                columns = {name: i for i, name in enumerate(self.headers[path])}
+                user_col, recipe_col, rating_col = columns['user_id'], columns['recipe_id'], columns['rating']
+
+                rows = [row for row in rows if row]
+                complete = [row for row in rows if len(row) == len(columns)]
+                # The offset moves with the events under the lock, so a checkpoint never records one without the other.
+                with self.lock:
+                    self.skipped += len(rows) - len(complete)
+                    if complete:
+                        self.ingest_batch([row[user_col] for row in complete], [row[recipe_col] for row in complete],
+                                          [row[rating_col] for row in complete])
+                    self.offsets[path] = offset
+        return self.events - before
+
+    def checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        with self.lock:
+            n_users = len(self.user_index)
+            arrays = {
+                "recipe_counts": self.recipe_counts.copy(),
+                "recipe_sums": self.recipe_sums.copy(),
+                "user_weights": self.user_weights[:n_users].copy(),
+                "user_sums": self.user_sums[:n_users].copy(),
+            }
+            meta = {
+                "recipe_ids": list(self.recipe_ids),
+                "user_ids": list(self.user_index),
+                "offsets": self.offsets,
+                "headers": self.headers,
+                "sum_of_means": self.sum_of_means,
+                "n_rated": self.n_rated,
+                "events": self.events,
+                "skipped": self.skipped,
+            }
+
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def restore(self):
+        """
+        Loads the checkpoint if there is one for the same recipe catalog.
+        Returns True when state was restored.
+        """
+        if self.checkpoint_path is None or not self.checkpoint_path.exists():
+            return False
+        with np.load(self.checkpoint_path) as checkpoint:
+            meta = json.loads(str(checkpoint["meta"]))
+            if meta["recipe_ids"] != list(self.recipe_ids):
+                return False
+            arrays = {name: checkpoint[name] for name in ("recipe_counts", "recipe_sums", "user_weights", "user_sums")}
+
+        with self.lock:
+            self.recipe_counts = arrays["recipe_counts"]
+            self.recipe_sums = arrays["recipe_sums"]
+            self.user_index = {user_id: row for row, user_id in enumerate(meta["user_ids"])}
+            capacity = max(1024, len(self.user_index))
+            self.user_weights = np.zeros(capacity)
+            self.user_weights[:len(self.user_index)] = arrays["user_weights"]
+            self.user_sums = np.zeros((capacity, self.recipe_features.shape[1]))
+            self.user_sums[:len(self.user_index)] = arrays["user_sums"]
+            self.offsets = meta["offsets"]
+            self.headers = meta["headers"]
+            self.sum_of_means = meta["sum_of_means"]
+            self.n_rated = meta["n_rated"]
+            self.events = meta["events"]
+            self.skipped = meta["skipped"]
+        return True
+
+    def run(self, stop_event, interval=5.0, checkpoint_interval=60.0, on_update=None):
+        """
+        Polls every interval seconds until stop_event is set, calling
+        on_update(self) after polls that ingested events and checkpointing
+        at most every checkpoint_interval seconds.
+        """
+        last_checkpoint = time.monotonic()
+        dirty = False
+        while not stop_event.is_set():
+            if self.poll():
+                dirty = True
+                if on_update is not None:
+                    on_update(self)
+            if dirty and time.monotonic() - last_checkpoint >= checkpoint_interval:
+                self.checkpoint()
+                last_checkpoint = time.monotonic()
+                dirty = False
+            stop_event.wait(interval)
+        if dirty:
+            self.checkpoint()
+
+    def start(self, interval=5.0, checkpoint_interval=60.0, on_update=None):
+        stop_event = threading.Event()
+        thread = threading.Thread(
+            target=self.run, args=(stop_event, interval, checkpoint_interval, on_update),
+            name="interaction-ingestor", daemon=True,
+        )
+        thread.start()
+        return stop_event, thread
+
+    def stats(self):
+        return {
+            "events": self.events,
+            "skipped": self.skipped,
+            "users": len(self.user_index),
+            "rated_recipes": self.n_rated,
+            "files": {path: offset for path, offset in self.offsets.items()},
+        }
+
+
+def main():
+    from load_data import load_df
+    from content_based import recipe_feature_matrix
+    import config
+
+    parser = argparse.ArgumentParser(description="Tail interaction logs and checkpoint running popularity/profile state.")
+    parser.add_argument("--patterns", nargs="+", default=config.INGEST_PATTERNS)
+    parser.add_argument("--checkpoint", default=config.INGEST_CHECKPOINT)
+    parser.add_argument("--once", action="store_true", help="Ingest what is there, checkpoint and exit")
+    parser.add_argument("--interval", type=float, default=config.INGEST_INTERVAL)
+    args = parser.parse_args()
+
+    _, recipes_df = load_df()
+    ingestor = InteractionIngestor(recipes_df['recipe_id'].astype(str).tolist(), recipe_feature_matrix(recipes_df),
+                                   args.patterns, checkpoint_path=args.checkpoint)
+    if ingestor.restore():
+        print(f"Restored {ingestor.events} events from {args.checkpoint}")
+
+    if args.once:
+        start = time.perf_counter()
+        ingested = ingestor.poll()
+        ingestor.checkpoint()
+        print(f"Ingested {ingested} events in {time.perf_counter() - start:.2f}s: {ingestor.stats()}")
+        return
+
+    stop_event = threading.Event()
+    try:
+        ingestor.run(stop_event, args.interval, on_update=lambda i: print(i.stats()))
+    except KeyboardInterrupt:
+        ingestor.checkpoint()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+
+class Interner:
+    """
+    Dense int32 codes for a fixed set of string ids, with each string
+    kept once for reverse lookup. A whole column is encoded with one
+    vectorized hash-table probe (pandas Index.get_indexer) rather than a
+    dict lookup per value, and -1 marks values outside the set. An id that
+    occurs more than once gets the position of its last occurrence, as
+    with a dict built in order.
+    """
+
+    def __init__(self, values):
+        self.values = np.array(list(values), dtype=object)
+        index = pd.Index(self.values)
+        self.positions = None
+        if not index.is_unique:
+            keep = ~index.duplicated(keep='last')
+            self.positions = np.flatnonzero(keep).astype(np.int32)
+            index = index[keep]
+        self.index = index
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __contains__(self, value):
+        return self.code(value) is not None
+
+    def encode(self, values):
+        """
+        Codes of a column, list or array of ids; -1 for unknown ids.
+        """
+        codes = self.index.get_indexer(values)
+        if self.positions is not None:
+            codes = np.where(codes >= 0, self.positions[codes], -1)
+        return codes.astype(np.int32, copy=False)
+
+    def code(self, value):
+        try:
+            code = self.index.get_loc(value)
+        except (KeyError, TypeError, pd.errors.InvalidIndexError):
+            return None
+        return int(code if self.positions is None else self.positions[code])
+
+    def decode(self, codes):
+        return self.values[np.asarray(codes)]
+
+
+def sort_ids(ids):
+    """
+    (sorted ids, row of each) for a fixed-width bytes array of ids by row,
+    the on-disk index SortedIds searches.
+    """
+    order = np.argsort(ids, kind='stable')
+    return ids[order], order.astype(np.int64)
+
+
+class SortedIds:
+    """
+    Interner counterpart over memory-mapped files: ids by row in a
+    StringTable and a sorted fixed-width id array with the row of each,
+    searched by bisection. Nothing is decoded or hashed up front, so
+    workers mapping the same files share them.
+    """
+
+    def __init__(self, table, sorted_ids, sorted_rows):
+        self.table = table
+        self.sorted_ids = sorted_ids
+        self.sorted_rows = sorted_rows
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.table[i].decode() for i in range(*row.indices(len(self)))]
+        return self.table[row].decode()
+
+    def __contains__(self, value):
+        return self.code(value) is not None
+
+    def encode(self, values):
+        """
+        Codes of a list or array of ids; -1 for unknown ids.
+        """
+        keys = [str(value).encode() for value in values]
+        if not keys or not len(self.sorted_ids):
+            return np.full(len(keys), -1, dtype=np.int32)
+        # Longer keys would be truncated to the fixed width and could match a prefix.
+        fits = np.array([len(key) <= self.sorted_ids.dtype.itemsize for key in keys])
+        keys = np.array(keys, dtype=self.sorted_ids.dtype)
+        positions = np.maximum(np.searchsorted(self.sorted_ids, keys, side='right') - 1, 0)
+        found = fits & (self.sorted_ids[positions] == keys)
+        return np.where(found, self.sorted_rows[positions], -1).astype(np.int32)
+
+    def code(self, value):
+        key = str(value).encode()
+        if len(key) > self.sorted_ids.dtype.itemsize:
+            return None
+        # The last of equal ids wins, as in Interner.
+        position = int(np.searchsorted(self.sorted_ids, key, side='right')) - 1
+        if position < 0 or self.sorted_ids[position] != key:
+            return None
+        return int(self.sorted_rows[position])
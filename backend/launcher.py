@@ -0,0 +1,58 @@
+import argparse
+import os
+import time
+from pathlib import Path
+from snapshot import compile_snapshot, is_current, read_manifest
+import config
+
+BASE_DIR = Path(__file__).resolve().parent
+SHM_DIR = Path('/dev/shm')
+
+
+def default_snapshot_dir():
+    if config.SNAPSHOT_DIR:
+        return Path(config.SNAPSHOT_DIR)
+    # tmpfs keeps the shared pages in RAM even when the disk cache is under pressure.
+    if SHM_DIR.is_dir():
+        return SHM_DIR / 'rrs-snapshot'
+    return BASE_DIR / '../snapshots/current'
+
+
+def prepare_snapshot(snapshot_dir, recompile=False):
+    """
+    Compiles the snapshot in the parent process unless snapshot_dir
+    already holds one built from the current sources.
+    """
+    if not recompile and is_current(snapshot_dir):
+        return read_manifest(snapshot_dir), False
+
+    from load_data import load_model, load_df
+
+    users_df, recipes_df = load_df()
+    return compile_snapshot(snapshot_dir, load_model(), users_df, recipes_df), True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the serving snapshot once and start uvicorn workers that memory-map it.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=80)
+    parser.add_argument("--snapshot-dir", type=Path, default=default_snapshot_dir())
+    parser.add_argument("--recompile", action="store_true", help="Compile even if the snapshot is up to date")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest, compiled = prepare_snapshot(args.snapshot_dir, args.recompile)
+    action = "Compiled" if compiled else "Reusing"
+    print(f"{action} snapshot {manifest['data_version']} in {args.snapshot_dir} ({time.perf_counter() - start:.2f}s)")
+
+    # Workers are spawned fresh and read their configuration from the environment.
+    os.environ["RRS_SNAPSHOT_DIR"] = str(args.snapshot_dir)
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, app_dir=str(BASE_DIR))
+
+
+if __name__ == "__main__":
+    main()
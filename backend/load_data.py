@@ -1,27 +1,86 @@
+import numpy as np
 import pandas as pd
-from twotower import TwoTowerModel
-import torch
+from feasibility import FeasibilityIndex
+from user_store import UserStore
+from recommendations import recipe_record, recipe_fragment
+from numpy_engine import NumpyTwoTowerModel, run_tower
+from content_based import ContentBasedEngine
+from cold_start import ColdStartEngine
 from pathlib import Path
+import config
 
 BASE_DIR = Path(__file__).resolve().parent
 
-def load_model():
+def load_torch_model(weights_path=BASE_DIR / "model_weights.pth"):
+    import torch
+    from twotower import TwoTowerModel
+
     model = TwoTowerModel(user_dim=4, item_dim=4, embedding_dim=32)
-    model.load_state_dict(torch.load(BASE_DIR / "model_weights.pth", map_location=torch.device('cpu')))
+    model.load_state_dict(torch.load(weights_path, map_location=torch.device('cpu')))
     model.eval()
     return model
 
-def load_df():
-    users_df = pd.read_csv(BASE_DIR / '../student_data/users.csv').fillna(0)
-    recipes_df = pd.read_csv(BASE_DIR / '../student_data/recipes.csv').fillna(0)
+def load_model(quantize_towers=None):
+    model = NumpyTwoTowerModel.from_npz(config.NUMPY_WEIGHTS) if config.ENGINE == "numpy" else load_torch_model()
+    if config.QUANTIZE_TOWERS if quantize_towers is None else quantize_towers:
+        from quantization import quantize_towers as quantize
+        model = quantize(model)
+    return model
+
+def load_interaction_codes(paths, recipe_ids, user_ids=None, chunk_size=1_000_000):
+    """
+    Reads the interaction logs in chunks and keeps only int32 recipe (and,
+    given user_ids, user) codes from the Interners plus float64 ratings,
+    missing ratings counted as 2.5. The id strings of a chunk are dropped
+    once it is encoded.
+    """
+    columns = ['recipe_id', 'rating'] + (['user_id'] if user_ids is not None else [])
+    users, recipes, ratings = [], [], []
+    for path in paths:
+        if not Path(path).exists():
+            continue
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+            recipes.append(recipe_ids.encode(chunk['recipe_id']))
+            ratings.append(chunk['rating'].fillna(2.5).to_numpy(dtype=np.float64))
+            if user_ids is not None:
+                users.append(user_ids.encode(chunk['user_id']))
+
+    def concat(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    return (concat(users, np.int32) if user_ids is not None else None), concat(recipes, np.int32), concat(ratings, np.float64)
+
+def load_users_df():
+    return pd.read_csv(config.DATA_DIR / 'users.csv').fillna(0)
+
+def load_recipes_df():
+    return pd.read_csv(config.DATA_DIR / 'recipes.csv').fillna(0)
 
-    return users_df, recipes_df
+def load_df():
+    return load_users_df(), load_recipes_df()
 
 def load_recipe_embeddings(model, recipes_df):
-    recipe_features = recipes_df[['taste_bitterness', 'taste_sweetness', 'taste_acidity', 'taste_body']].values
-    recipe_tensor = torch.tensor(recipe_features, dtype=torch.float32)
+    recipe_features = recipes_df[['taste_bitterness', 'taste_sweetness', 'taste_acidity', 'taste_body']].to_numpy(dtype=np.float32)
+    return run_tower(model.item_mlp, recipe_features)
+
+def load_feasibility_index(recipes_df):
+    return FeasibilityIndex.from_recipes(recipes_df)
+
+def load_user_store(users_df, feasibility_index):
+    return UserStore.from_users_df(users_df, feasibility_index)
+
+def load_disk_user_store(feasibility_index):
+    from disk_user_store import DiskUserStore
+    return DiskUserStore.open(config.USER_STORE_DIR, feasibility_index, config.USER_CACHE_ROWS)
+
+def load_recipe_records(recipes_df):
+    return [recipe_record(recipe) for recipe in recipes_df.to_dict('records')]
+
+def load_recipe_fragments(recipes_df):
+    return [recipe_fragment(recipe) for recipe in recipes_df.to_dict('records')]
+
+def load_content_engine(recipes_df, feasibility_index):
+    return ContentBasedEngine.from_recipes(recipes_df, feasibility_index)
 
-    with torch.no_grad():
-        recipe_embeddings = model.item_mlp(recipe_tensor)
-        
-    return recipe_embeddings
\ No newline at end of file
+def load_cold_start_engine(interaction_paths, recipe_ids, content_engine):
+    _, recipe_idx, ratings = load_interaction_codes(interaction_paths, recipe_ids)
+    return ColdStartEngine.from_interactions(recipe_idx, ratings, len(recipe_ids), content_engine)
@@ -1,20 +1,28 @@
-from fastapi import FastAPI, HTTPException, Request
+import asyncio
+from fastapi import FastAPI, HTTPException, Request, Response, Header
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from schemas import RecipeRecommendation
-from load_data import load_model, load_df, load_recipe_embeddings
-from recommendations import get_recommendations
-from typing import List
+from fastapi.responses import PlainTextResponse
+from pydantic import TypeAdapter
+from schemas import RecipeRecommendation, BatchPredictRequest, BatchRecommendation, RecommendationsV2, ColdStartRequest, ColdStartRecommendations, FoldInRequest
+from recommendations import get_batch_recommendations, get_recommendations_v2, get_fallback_recommendations, encode_recipes
+from typing import List, Optional
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
+from batching import MicroBatcher
+from admission import LatencyBudget
+from serving import ServingState
+import config
+import metrics
 
 BASE_DIR = Path(__file__).resolve().parent
 
 app = FastAPI()
 
-model = load_model()
-users_df, recipes_df = load_df()
-recipe_embeddings = load_recipe_embeddings(model, recipes_df)
+serving = ServingState(cache_bytes=int(config.RESULT_CACHE_MB * 2 ** 20))
+serving.reload(reason="startup")
+if config.RELOAD_WATCH_INTERVAL > 0:
+    serving.start_watcher(config.RELOAD_WATCH_INTERVAL)
 
 origins = [
     "http://localhost:8000",
@@ -32,18 +40,201 @@ app.add_middleware(
 
 templates = Jinja2Templates(directory="templates")
 
+if config.PROFILE_SLOW_MS > 0:
+    metrics.start_profiler(config.PROFILE_SLOW_MS, config.PROFILE_DIR, config.PROFILE_INTERVAL_MS)
+
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+recommendations_adapter = TypeAdapter(List[RecipeRecommendation])
+
+def encode_recommendations(results):
+    with metrics.stage("serialize"):
+        return recommendations_adapter.dump_json(recommendations_adapter.validate_python(results))
+
+def resolve_ranker(bundle, name):
+    name = name or bundle.default_ranker
+    if name not in bundle.rankers:
+        raise HTTPException(status_code=400, detail=f"Unknown ranker {name}, expected one of {sorted(bundle.rankers)}")
+    return name
+
+def predict_many(requests):
+    """
+    requests: list of (user_id, k, ranker name, bundle) tuples, where the
+    ranker was resolved on the bundle the handler read; users sharing a
+    bundle and ranker are scored together. A batch formed across a reload
+    thus never mixes bundles within a request.
+    """
+    results = [None] * len(requests)
+    groups = {}
+    for i, (_, _, name, bundle) in enumerate(requests):
+        groups.setdefault((id(bundle), name), []).append(i)
+
+    for indices in groups.values():
+        _, _, name, bundle = requests[indices[0]]
+        ranker = bundle.rankers[name]
+        batch = [requests[i][:2] for i in indices]
+        for i, recs in zip(indices, get_batch_recommendations(bundle.user_store, bundle.recipe_records, ranker, batch)):
+            results[i] = recs
+    return results
+
+def predict_encoded(requests):
+    """
+    predict_many serialized to JSON in the worker thread, which keeps
+    pydantic validation off the event loop.
+    """
+    return [None if results is None else encode_recommendations(results) for results in predict_many(requests)]
+
+if config.MICROBATCH_ENABLED:
+    batcher = MicroBatcher(predict_encoded, config.MICROBATCH_MAX_SIZE, config.MICROBATCH_MAX_WAIT_US)
+    submit_one = batcher.enqueue
+    withdraw = batcher.withdraw
+else:
+    batcher = None
+    withdraw = None
+
+    def submit_one(request):
+        return asyncio.get_running_loop().run_in_executor(None, lambda: predict_encoded([request])[0])
+
+latency_budget = LatencyBudget(config.PREDICT_BUDGET_MS, config.PREDICT_MAX_PENDING)
+
+def predict_fallback(bundle, user_id, k):
+    with metrics.stage("fallback"):
+        return get_fallback_recommendations(bundle.user_store, bundle.recipe_records, bundle.feasibility_index,
+                                            bundle.cold_start_engine, user_id, k)
+
 @app.get("/predict", response_model=List[RecipeRecommendation])
-def predict_top_k(
-    user_id: str, 
-    k: int =5 
+async def predict_top_k(
+    user_id: str,
+    k: int = 5,
+    ranker: Optional[str] = None,
+    budget_ms: Optional[float] = None
 ):
-    results = get_recommendations(users_df, recipes_df, recipe_embeddings, model, user_id, k)
-    if results is None:
+    bundle = serving.bundle
+    request = (user_id, k, resolve_ranker(bundle, ranker), bundle)
+    # Unknown users are answered before admission so they are never counted as degraded.
+    if bundle.user_store.lookup(user_id) is None:
+        metrics.record_not_found()
         raise HTTPException(status_code=404, detail=f"User {user_id} not found")
-    
-    return results
 
-    
+    content, degraded = await latency_budget.run(lambda: submit_one(request), budget_ms, withdraw)
+    if degraded:
+        # Bounded by k and cheap, so it runs here rather than queueing behind the ranking threads.
+        results = predict_fallback(bundle, user_id, k)
+        content = None if results is None else encode_recommendations(results)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+
+    response = Response(content=content, media_type="application/json")
+    if degraded:
+        response.headers["X-Degraded"] = degraded
+    return response
+
+@app.get("/predict/stats")
+def predict_stats():
+    stats = batcher.stats() if batcher is not None else {"enabled": False}
+    return {**stats, "latency_budget": latency_budget.stats()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    if serving.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **serving.cache.stats()}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ingestion/stats")
+def ingestion_stats():
+    ingestor = serving.bundle.ingestor
+    if ingestor is None:
+        return {"enabled": False}
+    return {"enabled": True, **ingestor.stats()}
+
+@app.get("/predict/history", response_model=ColdStartRecommendations)
+def predict_from_history(user_id: str, k: int = 5):
+    bundle = serving.bundle
+    if bundle.ingestor is None:
+        raise HTTPException(status_code=404, detail="Ingestion is not enabled")
+    profile = bundle.ingestor.user_profile(user_id)
+    if profile is None:
+        top_indices, top_scores = bundle.cold_start_engine.popular(k)
+    else:
+        row = bundle.user_store.lookup(user_id)
+        user_mask = None if row is None else bundle.user_store.masks[row]
+        top_indices, top_scores = bundle.cold_start_engine.nearest(profile, user_mask, k)
+    content = b'{"recipes":' + encode_recipes(bundle.recipe_fragments, top_indices, top_scores) + b'}'
+
+    return Response(content=content, media_type="application/json")
+
+def check_admin_token(token):
+    if config.ADMIN_TOKEN and token != config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/reload")
+def reload_bundle(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    try:
+        timings = serving.reload()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed, still serving the previous bundle: {e!r}")
+    if timings is None:
+        raise HTTPException(status_code=409, detail="A reload is already running")
+
+    return timings
+
+@app.get("/admin/reload")
+def reload_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    return serving.stats()
+
+@app.post("/users/{user_id}/interactions")
+def fold_in_interactions(user_id: str, request: FoldInRequest):
+    rankers = serving.bundle.rankers
+    if "collaborative" not in rankers:
+        raise HTTPException(status_code=404, detail="Collaborative filtering is not enabled")
+    recipe_ids = [interaction.recipe_id for interaction in request.interactions]
+    ratings = [2.5 if interaction.rating is None else interaction.rating for interaction in request.interactions]
+    factors = rankers["collaborative"].fold_in(user_id, recipe_ids, ratings)
+    if serving.cache is not None:
+        serving.cache.invalidate(user_id)
+
+    return {"user_id": user_id, "factors": len(factors)}
+
+@app.post("/predict/batch", response_model=List[BatchRecommendation])
+def predict_batch(request: BatchPredictRequest):
+    bundle = serving.bundle
+    ranker = resolve_ranker(bundle, request.ranker)
+    requests = [(user.user_id, user.k, ranker, bundle) for user in request.users]
+    results = predict_many(requests)
+
+    return [
+        {"user_id": user_id, "found": recs is not None, "recommendations": recs or []}
+        for (user_id, _, _, _), recs in zip(requests, results)
+    ]
+
+@app.get("/v2/predict", response_model=RecommendationsV2)
+def predict_top_k_v2(
+    user_id: str,
+    k: int = 5,
+    ranker: Optional[str] = None
+):
+    bundle = serving.bundle
+    content = get_recommendations_v2(bundle.user_store, bundle.recipe_fragments, bundle.rankers[resolve_ranker(bundle, ranker)], user_id, k)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"User {user_id} not found")
+
+    return Response(content=content, media_type="application/json")
+
+@app.post("/predict/cold", response_model=ColdStartRecommendations)
+def predict_cold_start(request: ColdStartRequest):
+    bundle = serving.bundle
+    top_indices, top_scores = bundle.cold_start_engine.recommend(request.equipment, request.products, request.taste, request.k)
+    content = b'{"recipes":' + encode_recipes(bundle.recipe_fragments, top_indices, top_scores) + b'}'
+
+    return Response(content=content, media_type="application/json")
+
 app.mount("/", StaticFiles(directory=BASE_DIR / "../front", html=True), name="front")
 
 @app.get('/')
@@ -0,0 +1,264 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from snapshot import DEFAULT_SOURCES, file_fingerprint, model_path, read_manifest
+from metrics import record_topk_table
+import config
+
+FORMAT_VERSION = 1
+RANKERS = ("two_tower", "content_based")
+# Scores of one chunk are a rows x recipes float32 matrix; chunks are sized to stay under this.
+CHUNK_BYTES = 256 * 2 ** 20
+
+
+def serving_fingerprints():
+    """
+    Fingerprints of the model weights and the users/recipes data the
+    server would load with the current configuration; with a snapshot the
+    data fingerprints are the ones it was compiled from.
+    """
+    fingerprints = {"model": file_fingerprint(model_path())}
+    if config.SNAPSHOT_DIR:
+        sources = read_manifest(config.SNAPSHOT_DIR)["sources"]
+        fingerprints.update(users=sources["users"], recipes=sources["recipes"])
+    else:
+        fingerprints.update(users=file_fingerprint(DEFAULT_SOURCES["users"]),
+                            recipes=file_fingerprint(DEFAULT_SOURCES["recipes"]))
+    if config.USER_STORE_DIR:
+        from disk_user_store import read_manifest as read_store_manifest
+        fingerprints["users"] = read_store_manifest(config.USER_STORE_DIR)["sources"]["users"]
+    return fingerprints
+
+
+def ranker_settings(ranker_name):
+    """
+    Configuration that changes what a ranker returns for the same inputs.
+    """
+    if ranker_name != "two_tower":
+        return {}
+    return {
+        "engine": config.ENGINE,
+        "retrieval": config.RETRIEVAL,
+        "ivf_lists": config.IVF_LISTS,
+        "ivf_nprobe": config.IVF_NPROBE,
+        "embedding_precision": config.EMBEDDING_PRECISION,
+        "quantize_towers": config.QUANTIZE_TOWERS,
+    }
+
+
+class TopKTable:
+    """
+    Materialized top-k recipes of every user row for one ranker: int32
+    recipe indices and float32 scores as (n_users, k) arrays padded with
+    -1, plus the number of valid entries per row, all memory-mapped.
+    """
+
+    def __init__(self, manifest, indices, scores, counts):
+        self.manifest = manifest
+        self.indices = indices
+        self.scores = scores
+        self.counts = counts
+        self.k = manifest["k"]
+        self.ranker = manifest["ranker"]
+
+    @classmethod
+    def open(cls, table_dir, mmap_mode='r'):
+        table_dir = Path(table_dir)
+        with open(table_dir / 'manifest.json') as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Top-k table format {manifest.get('format_version')} is not supported, expected {FORMAT_VERSION}")
+        return cls(manifest,
+                   np.load(table_dir / 'indices.npy', mmap_mode=mmap_mode),
+                   np.load(table_dir / 'scores.npy', mmap_mode=mmap_mode),
+                   np.load(table_dir / 'counts.npy', mmap_mode=mmap_mode))
+
+    def stale_reason(self, fingerprints, n_users, n_recipes):
+        """
+        None when the table was built from these sources and the current
+        ranker settings, otherwise why it cannot be served.
+        """
+        changed = sorted(name for name, value in fingerprints.items() if self.manifest["sources"].get(name) != value)
+        if changed:
+            return f"{', '.join(changed)} changed"
+        if self.manifest["settings"] != ranker_settings(self.ranker):
+            return "ranker settings changed"
+        if (self.manifest["n_users"], self.manifest["n_recipes"]) != (n_users, n_recipes):
+            return "catalog size changed"
+        return None
+
+    def lookup(self, row, k):
+        n = min(k, int(self.counts[row]))
+        return np.asarray(self.indices[row, :n], dtype=np.int64), np.asarray(self.scores[row, :n])
+
+
+class MaterializedRanker:
+    """
+    Serves rank() from a TopKTable and hands requests for more than
+    table.k recipes to the live ranker.
+    """
+
+    def __init__(self, table, ranker):
+        self.table = table
+        self.ranker = ranker
+
+    def __getattr__(self, name):
+        # Everything but rank(), e.g. CollaborativeEngine.fold_in, goes to the wrapped ranker.
+        return getattr(self.ranker, name)
+
+    def rank(self, user_store, rows, ks):
+        live = [i for i, k in enumerate(ks) if k > self.table.k]
+        record_topk_table(len(ks) - len(live), len(live))
+        if not live:
+            return [self.table.lookup(row, k) for row, k in zip(rows, ks)]
+
+        results = [None if k > self.table.k else self.table.lookup(row, k) for row, k in zip(rows, ks)]
+        live_rows = np.asarray(rows)[live]
+        for i, ranking in zip(live, self.ranker.rank(user_store, live_rows, [ks[i] for i in live])):
+            results[i] = ranking
+        return results
+
+
+def open_fresh_table(table_dir, rankers, n_users, n_recipes):
+    """
+    Returns (table, None) when table_dir holds a table that is fresh for
+    the current model, data and settings, else (None, reason).
+    """
+    try:
+        table = TopKTable.open(table_dir)
+    except (OSError, ValueError, KeyError) as e:
+        return None, f"cannot be opened ({e})"
+    if table.ranker not in rankers:
+        return None, f"ranker {table.ranker} is not enabled"
+    try:
+        reason = table.stale_reason(serving_fingerprints(), n_users, n_recipes)
+    except OSError as e:
+        reason = f"sources cannot be fingerprinted ({e})"
+    return (None, reason) if reason else (table, None)
+
+
+_worker_state = None
+
+
+def _init_worker(bundle, ranker_name, threads):
+    global _worker_state
+    _worker_state = (bundle, bundle.rankers[ranker_name])
+    if threads and config.ENGINE == "torch":
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _rank_chunk(start, end, k):
+    bundle, ranker = _worker_state
+    rows = np.arange(start, end)
+    indices = np.full((len(rows), k), -1, dtype=np.int32)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    counts = np.zeros(len(rows), dtype=np.int32)
+    for i, (top_indices, top_scores) in enumerate(ranker.rank(bundle.user_store, rows, [k] * len(rows))):
+        counts[i] = len(top_indices)
+        indices[i, :counts[i]] = top_indices
+        scores[i, :counts[i]] = top_scores
+    return start, indices, scores, counts
+
+
+def materialize(out_dir, ranker_name="two_tower", k=20, workers=1, chunk_size=1024):
+    """
+    Runs the ranker for every user row in chunks across a process pool and
+    writes the table to out_dir. Each array is written to a temporary file
+    and renamed into place, and the manifest goes last, so servers that
+    have the previous table mapped never see a partial one.
+    """
+    from serving import build_bundle
+
+    start_time = time.perf_counter()
+    fingerprints = serving_fingerprints()
+    bundle = build_bundle(materialized=False)
+    if ranker_name not in bundle.rankers:
+        raise ValueError(f"Ranker {ranker_name} is not enabled, expected one of {sorted(bundle.rankers)}")
+    n_users, n_recipes = len(bundle.user_store), len(bundle.recipe_ids)
+    chunk_size = max(1, min(chunk_size, CHUNK_BYTES // (4 * max(n_recipes, 1))))
+    chunks = [(start, min(start + chunk_size, n_users)) for start in range(0, n_users, chunk_size)]
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    arrays = {
+        "indices": np.lib.format.open_memmap(out_dir / 'indices.npy.tmp', mode='w+', dtype=np.int32, shape=(n_users, k)),
+        "scores": np.lib.format.open_memmap(out_dir / 'scores.npy.tmp', mode='w+', dtype=np.float32, shape=(n_users, k)),
+        "counts": np.lib.format.open_memmap(out_dir / 'counts.npy.tmp', mode='w+', dtype=np.int32, shape=(n_users,)),
+    }
+
+    threads = 1 if workers > 1 else 0
+    # Workers inherit the bundle through fork instead of pickling it: it holds locks and mapped arrays.
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"), initializer=_init_worker,
+                                   initargs=(bundle, ranker_name, threads)) if workers > 1 else None
+    if executor is None:
+        _init_worker(bundle, ranker_name, threads)
+    try:
+        starts, ends = zip(*chunks) if chunks else ((), ())
+        parts = map(_rank_chunk, starts, ends, [k] * len(chunks)) if executor is None else \
+            executor.map(_rank_chunk, starts, ends, [k] * len(chunks))
+        for start, indices, scores, counts in parts:
+            arrays["indices"][start:start + len(counts)] = indices
+            arrays["scores"][start:start + len(counts)] = scores
+            arrays["counts"][start:start + len(counts)] = counts
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for name, array in arrays.items():
+        array.flush()
+        os.replace(out_dir / f'{name}.npy.tmp', out_dir / f'{name}.npy')
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "ranker": ranker_name,
+        "k": k,
+        "n_users": n_users,
+        "n_recipes": n_recipes,
+        "sources": fingerprints,
+        "settings": ranker_settings(ranker_name),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "build_seconds": time.perf_counter() - start_time,
+    }
+    with open(out_dir / 'manifest.json.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(out_dir / 'manifest.json.tmp', out_dir / 'manifest.json')
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the top-k recipes of every known user for O(1) serving.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Materialize the table for the current model and data")
+    build_parser.add_argument("--out", type=Path, default=config.TOPK_TABLE_DIR)
+    build_parser.add_argument("--ranker", choices=RANKERS, default="two_tower")
+    build_parser.add_argument("--k", type=int, default=20, help="Largest k served from the table")
+    build_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    build_parser.add_argument("--chunk-size", type=int, default=1024, help="Users ranked per task")
+    status_parser = subparsers.add_parser("status", help="Report whether the table can be served")
+    status_parser.add_argument("--dir", type=Path, default=config.TOPK_TABLE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        manifest = materialize(args.out, args.ranker, args.k, args.workers, args.chunk_size)
+        print(f"Top-{manifest['k']} {manifest['ranker']} recommendations for {manifest['n_users']} users written to "
+              f"{args.out} in {manifest['build_seconds']:.2f}s ({args.workers} workers)")
+    elif args.command == "status":
+        try:
+            table = TopKTable.open(args.dir)
+        except (OSError, ValueError) as e:
+            print(f"No servable table in {args.dir}: {e}")
+            return
+        manifest = table.manifest
+        reason = table.stale_reason(serving_fingerprints(), manifest["n_users"], manifest["n_recipes"])
+        state = "fresh" if reason is None else f"stale: {reason}"
+        print(f"Top-{table.k} {table.ranker} table for {manifest['n_users']} users built {manifest['created_at']}, {state}")
+
+
+if __name__ == "__main__":
+    main()
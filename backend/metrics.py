@@ -0,0 +1,328 @@
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter, deque
+from contextlib import nullcontext
+from pathlib import Path
+import numpy as np
+import config
+
+logger = logging.getLogger("uvicorn.error")
+
+ENABLED = config.METRICS_ENABLED
+TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 1000000)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def observe_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        counts = np.bincount(np.searchsorted(self.buckets, values), minlength=len(self.counts))
+        with self.lock:
+            for i in np.flatnonzero(counts):
+                self.counts[i] += int(counts[i])
+            self.sum += float(values.sum())
+
+
+class Metric:
+    """
+    A metric family with a fixed set of label names; labels(*values)
+    returns the child for one combination of label values.
+    """
+    kind = None
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.children = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.children.items()):
+            lines += self._render_child(values, child)
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.label_names, values)} {child.value}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, label_names)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child):
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += count
+            labels = _format_labels(self.label_names, values, [f'le="{bound}"'])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram("rrs_stage_seconds", "Time spent in each serving stage.", ("stage",))
+REQUEST_SECONDS = Histogram("rrs_request_seconds", "HTTP request latency by route.", ("path",))
+REQUESTS = Counter("rrs_requests_total", "HTTP requests by route and status code.", ("path", "status"))
+USERS_NOT_FOUND = Counter("rrs_users_not_found_total", "Recommendation requests for unknown users.")
+CANDIDATES_SCANNED = Histogram("rrs_candidates_scanned", "Recipes scored per query.", ("retriever",), COUNT_BUCKETS)
+CANDIDATES_FEASIBLE = Histogram("rrs_candidates_feasible", "Feasible recipes among those scored per query.",
+                                ("retriever",), COUNT_BUCKETS)
+TOPK_TABLE = Counter("rrs_topk_table_total", "Rankings served from the materialized top-k table or live.", ("result",))
+RESULT_CACHE = Counter("rrs_result_cache_total", "Result cache hits, misses, evictions and invalidations.", ("result",))
+DEGRADED = Counter("rrs_degraded_total", "Predictions answered with the popularity fallback, by reason.", ("reason",))
+SLOW_REQUESTS = Counter("rrs_slow_requests_total", "Requests slower than the profiling threshold.", ("path",))
+
+
+class _StageTimer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+_DISABLED = nullcontext()
+
+
+def stage(name):
+    """
+    Context manager timing one serving stage into rrs_stage_seconds.
+    """
+    if not ENABLED:
+        return _DISABLED
+    return _StageTimer(STAGE_SECONDS.labels(name))
+
+
+def record_candidates(retriever, scanned, feasible):
+    """
+    Per-query counts of scored and feasible recipes, as arrays or scalars.
+    """
+    if ENABLED:
+        CANDIDATES_SCANNED.labels(retriever).observe_many(np.atleast_1d(scanned))
+        CANDIDATES_FEASIBLE.labels(retriever).observe_many(np.atleast_1d(feasible))
+
+
+def record_not_found(count=1):
+    if ENABLED and count:
+        USERS_NOT_FOUND.labels().inc(count)
+
+
+def record_topk_table(hits, misses):
+    if ENABLED:
+        if hits:
+            TOPK_TABLE.labels("hit").inc(hits)
+        if misses:
+            TOPK_TABLE.labels("live").inc(misses)
+
+
+def record_cache(result, count=1):
+    if ENABLED:
+        RESULT_CACHE.labels(result).inc(count)
+
+
+def record_degraded(reason):
+    if ENABLED:
+        DEGRADED.labels(reason).inc()
+
+
+def record_request(path, status, start, end):
+    elapsed = end - start
+    REQUESTS.labels(path, str(status)).inc()
+    REQUEST_SECONDS.labels(path).observe(elapsed)
+    if profiler is not None and elapsed * 1000 >= profiler.threshold_ms:
+        SLOW_REQUESTS.labels(path).inc()
+        profiler.report(path, start, end)
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware recording latency and status per route;
+    BaseHTTPMiddleware would add more overhead than the handlers it
+    measures.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by route template so path parameters do not create new series.
+            route = scope.get("route")
+            record_request(route.path if route is not None else "unmatched", status, start, time.perf_counter())
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+# Innermost frames of threads that are parked rather than working.
+IDLE_FRAMES = {("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select"), ("thread.py", "_worker")}
+
+
+class SlowRequestProfiler:
+    """
+    Samples the Python stacks of all busy threads every interval_ms into a
+    ring buffer covering the last window_s seconds. When a request ends
+    slower than threshold_ms, the samples taken while it ran are written
+    to out_dir as collapsed stacks (flamegraph.pl / speedscope input).
+    report() only queues the request; the sampling thread writes the file,
+    so the event loop never blocks on profile I/O.
+    """
+
+    def __init__(self, threshold_ms, out_dir, interval_ms=5.0, window_s=30.0):
+        self.threshold_ms = threshold_ms
+        self.out_dir = Path(out_dir)
+        self.interval = interval_ms / 1000
+        self.window = window_s
+        self.samples = deque()
+        self.slow_requests = deque()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.reports = 0
+
+    @staticmethod
+    def _collapse(frame):
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            return None
+        stack = []
+        while frame is not None:
+            stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            stacks = [self._collapse(frame) for ident, frame in sys._current_frames().items() if ident != own]
+            with self.lock:
+                self.samples.extend((now, stack) for stack in stacks if stack is not None)
+                while self.samples and self.samples[0][0] < now - self.window:
+                    self.samples.popleft()
+                slow_requests = list(self.slow_requests)
+                self.slow_requests.clear()
+            for path, start, end in slow_requests:
+                self.write(path, start, end)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self.thread.start()
+
+    def report(self, path, start, end):
+        with self.lock:
+            self.slow_requests.append((path, start, end))
+
+    def write(self, path, start, end):
+        with self.lock:
+            stacks = StackCounter(stack for at, stack in self.samples if start <= at <= end)
+        if not stacks:
+            return None
+        self.reports += 1
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        name = path.strip('/').replace('/', '_').replace('{', '').replace('}', '') or 'root'
+        out_path = self.out_dir / f"slow-{time.strftime('%Y%m%d-%H%M%S')}-{self.reports}-{int((end - start) * 1000)}ms-{name}.folded"
+        with open(out_path, 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        logger.warning(f"Slow request {path} took {(end - start) * 1000:.0f} ms, stack samples written to {out_path}")
+        return out_path
+
+
+profiler = None
+
+
+def start_profiler(threshold_ms, out_dir, interval_ms=5.0):
+    global profiler
+    profiler = SlowRequestProfiler(threshold_ms, out_dir, interval_ms)
+    profiler.start()
+    return profiler
@@ -0,0 +1,109 @@
+import argparse
+import sys
+import numpy as np
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+TOWERS = ("user_mlp", "item_mlp")
+
+
+class NumpyMLP:
+    """
+    Linear -> ReLU -> Linear tower evaluated with NumPy/BLAS. Weights are
+    stored transposed so the forward pass is two plain matmuls.
+    """
+
+    def __init__(self, w1, b1, w2, b2):
+        self.w1 = np.ascontiguousarray(w1.T, dtype=np.float32)
+        self.b1 = np.asarray(b1, dtype=np.float32)
+        self.w2 = np.ascontiguousarray(w2.T, dtype=np.float32)
+        self.b2 = np.asarray(b2, dtype=np.float32)
+
+    def __call__(self, features):
+        hidden = np.asarray(features, dtype=np.float32) @ self.w1 + self.b1
+        np.maximum(hidden, 0, out=hidden)
+        return hidden @ self.w2 + self.b2
+
+
+class NumpyTwoTowerModel:
+    def __init__(self, user_mlp, item_mlp):
+        self.user_mlp = user_mlp
+        self.item_mlp = item_mlp
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        towers = {
+            name: NumpyMLP(
+                state_dict[f"{name}.0.weight"], state_dict[f"{name}.0.bias"],
+                state_dict[f"{name}.2.weight"], state_dict[f"{name}.2.bias"],
+            )
+            for name in TOWERS
+        }
+        return cls(**towers)
+
+    @classmethod
+    def from_npz(cls, path):
+        with np.load(path) as weights:
+            return cls.from_state_dict(dict(weights))
+
+    def __call__(self, user_features, item_features):
+        return (self.user_mlp(user_features) * self.item_mlp(item_features)).sum(axis=1)
+
+
+def run_tower(tower, features):
+    """
+    Runs a NumPy or torch tower on a float32 NumPy batch and returns a
+    NumPy array, so callers never need to import torch themselves.
+    """
+    if isinstance(tower, NumpyMLP):
+        return tower(features)
+
+    import torch
+    with torch.no_grad():
+        return tower(torch.from_numpy(np.ascontiguousarray(features, dtype=np.float32))).numpy()
+
+
+def export_weights(weights_path, out_path):
+    import torch
+
+    state_dict = torch.load(weights_path, map_location=torch.device('cpu'))
+    np.savez(out_path, **{name: tensor.numpy() for name, tensor in state_dict.items()})
+
+
+def check_parity(weights_path, npz_path, n_samples=4096, seed=0):
+    """
+    Largest absolute difference between the torch and NumPy towers on
+    random inputs in the [0, 1] feature range.
+    """
+    import torch
+    from load_data import load_torch_model
+
+    torch_model = load_torch_model(weights_path)
+    numpy_model = NumpyTwoTowerModel.from_npz(npz_path)
+    features = np.random.default_rng(seed).random((n_samples, 4), dtype=np.float32)
+
+    with torch.no_grad():
+        expected = {name: getattr(torch_model, name)(torch.from_numpy(features)).numpy() for name in TOWERS}
+    return max(float(np.abs(getattr(numpy_model, name)(features) - expected[name]).max()) for name in TOWERS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export TwoTowerModel weights for torch-free serving.")
+    parser.add_argument("command", choices=["export", "parity"])
+    parser.add_argument("--weights", default=BASE_DIR / "model_weights.pth")
+    parser.add_argument("--out", default=BASE_DIR / "model_weights.npz")
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_weights(args.weights, args.out)
+        print(f"Exported {args.weights} to {args.out}")
+
+    error = check_parity(args.weights, args.out)
+    print(f"Max abs difference between torch and NumPy towers: {error:.2e}")
+    if error > args.tolerance:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
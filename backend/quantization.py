@@ -0,0 +1,250 @@
+import argparse
+import json
+import time
+import warnings
+import numpy as np
+from pathlib import Path
+from numpy_engine import NumpyMLP, NumpyTwoTowerModel, TOWERS, run_tower
+import config
+
+PRECISIONS = ("float32", "float16", "int8")
+
+
+class QuantizedEmbeddings:
+    """
+    Item embeddings stored as float16, or as int8 codes with one float32
+    scale per row (symmetric, scale = max |value| / 127). Indexing returns
+    dequantized float32 rows; dot() converts block_rows rows at a time so
+    the float32 copy of the whole catalog is never materialized.
+    """
+
+    def __init__(self, values, scales=None, block_rows=16384):
+        self.values = values
+        self.scales = scales
+        self.block_rows = block_rows
+
+    @classmethod
+    def quantize(cls, embeddings, precision):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if precision == "float16":
+            return cls(embeddings.astype(np.float16))
+        if precision == "int8":
+            scales = np.abs(embeddings).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            codes = np.rint(embeddings / scales[:, None]).astype(np.int8)
+            return cls(codes, scales.astype(np.float32))
+        raise ValueError(f"Unknown embedding precision {precision!r}, expected one of {PRECISIONS}")
+
+    @property
+    def precision(self):
+        return "int8" if self.scales is not None else "float16"
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, rows):
+        block = self.values[rows].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][..., None]
+        return block
+
+    def dot(self, queries):
+        """
+        queries @ embeddings.T in float32. For int8 the per-row scale is
+        applied to the (queries, block) product rather than to the codes.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((len(queries), len(self.values)), dtype=np.float32)
+        for start in range(0, len(self.values), self.block_rows):
+            end = start + self.block_rows
+            np.matmul(queries, self.values[start:end].astype(np.float32).T, out=scores[:, start:end])
+            if self.scales is not None:
+                scores[:, start:end] *= self.scales[start:end]
+        return scores
+
+    def dequantize(self):
+        return self[:]
+
+
+def quantize_embeddings(embeddings, precision):
+    """
+    The embeddings as a float32 array for "float32", otherwise as
+    QuantizedEmbeddings.
+    """
+    if precision == "float32":
+        return np.asarray(embeddings, dtype=np.float32)
+    return QuantizedEmbeddings.quantize(embeddings, precision)
+
+
+def quantize_rows(x):
+    """
+    Symmetric int8 quantization with one scale per row.
+    """
+    scales = np.abs(x).max(axis=-1, keepdims=True) / 127
+    scales[scales == 0] = 1.0
+    return np.rint(x / scales).astype(np.int8), scales.astype(np.float32)
+
+
+class QuantizedNumpyMLP(NumpyMLP):
+    """
+    NumpyMLP with dynamically quantized linear layers, the NumPy
+    counterpart of torch's quantize_dynamic: weights are int8 with one
+    scale per output channel, activations are quantized per row at call
+    time, products are accumulated in int32 and rescaled to float32.
+    """
+
+    def __init__(self, w1, b1, w2, b2):
+        super().__init__(w1, b1, w2, b2)
+        self.q1, self.s1 = quantize_rows(self.w1.T)
+        self.q2, self.s2 = quantize_rows(self.w2.T)
+
+    @staticmethod
+    def _linear(x, codes, scales, bias):
+        x_codes, x_scales = quantize_rows(x)
+        acc = x_codes.astype(np.int32) @ codes.T.astype(np.int32)
+        return acc.astype(np.float32) * x_scales * scales.T + bias
+
+    def __call__(self, features):
+        hidden = self._linear(np.asarray(features, dtype=np.float32), self.q1, self.s1, self.b1)
+        np.maximum(hidden, 0, out=hidden)
+        return self._linear(hidden, self.q2, self.s2, self.b2)
+
+    @classmethod
+    def from_mlp(cls, mlp):
+        return cls(mlp.w1.T, mlp.b1, mlp.w2.T, mlp.b2)
+
+
+def quantize_towers(model):
+    """
+    A copy of the model with int8 dynamically quantized towers, for either
+    engine.
+    """
+    if isinstance(model, NumpyTwoTowerModel):
+        return NumpyTwoTowerModel(**{name: QuantizedNumpyMLP.from_mlp(getattr(model, name)) for name in TOWERS})
+
+    import torch
+    with warnings.catch_warnings():
+        # torch announces the move of eager-mode quantization to torchao; the API still works.
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def rank_correlation(a, b):
+    """
+    Mean Spearman correlation between matching rows of two score matrices.
+    """
+    ranks_a = a.argsort(axis=1).argsort(axis=1).astype(np.float64)
+    ranks_b = b.argsort(axis=1).argsort(axis=1).astype(np.float64)
+    ranks_a -= ranks_a.mean(axis=1, keepdims=True)
+    ranks_b -= ranks_b.mean(axis=1, keepdims=True)
+    denominator = np.sqrt((ranks_a ** 2).sum(axis=1) * (ranks_b ** 2).sum(axis=1))
+    return float(((ranks_a * ranks_b).sum(axis=1) / np.maximum(denominator, 1e-12)).mean())
+
+
+def top_k_agreement(reference, results):
+    """
+    Share of the reference top-k recipes that the other results also return.
+    """
+    hits = sum(len(set(expected) & set(got)) for (expected, _), (got, _) in zip(reference, results))
+    total = sum(len(expected) for expected, _ in reference)
+    return hits / total if total else 1.0
+
+
+def accuracy_report(data, precisions, tower_options, val_paths=(), k=10, n_users=2000, n_recipes=10000, seed=0):
+    """
+    Compares every (embedding precision, quantized towers) variant with
+    the float32 model on a sample of users: top-k agreement of feasible
+    recommendations, Spearman correlation and largest error of the raw
+    scores, embedding memory, scoring latency and the NDCG@k change on
+    each validation file.
+    """
+    from load_data import load_df, load_model, load_recipe_embeddings
+    from retrieval import ExactRetriever, build_retriever
+    from evaluation import evaluate
+
+    _, recipes_df = load_df()
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(data.user_store), min(n_users, len(data.user_store)), replace=False))
+    sample = np.sort(rng.choice(len(recipes_df), min(n_recipes, len(recipes_df)), replace=False))
+    user_masks = data.user_store.masks[rows]
+    ks = [k] * len(rows)
+
+    # The reference is the float32 model even when RRS_QUANTIZE_TOWERS is set.
+    model = data.model = load_model(quantize_towers=False)
+    embeddings = load_recipe_embeddings(model, recipes_df)
+    queries = run_tower(model.user_mlp, data.user_store.taste[rows])
+    reference_scores = queries @ embeddings[sample].T
+    reference_retriever = data.retriever = ExactRetriever(embeddings, data.feasibility_index)
+    reference = reference_retriever.search_batch(queries, user_masks, ks)
+    reference_ndcg = {Path(path).name: evaluate(data, path, ["two_tower"], k)["two_tower"][f"ndcg@{k}"] for path in val_paths}
+
+    report = []
+    for quantized_towers in tower_options:
+        variant_model = quantize_towers(model) if quantized_towers else model
+        variant_embeddings = load_recipe_embeddings(variant_model, recipes_df)
+        variant_queries = run_tower(variant_model.user_mlp, data.user_store.taste[rows])
+        for precision in precisions:
+            retriever = build_retriever("exact", variant_embeddings, data.feasibility_index, precision=precision)
+            start = time.perf_counter()
+            results = retriever.search_batch(variant_queries, user_masks, ks)
+            latency_ms = (time.perf_counter() - start) * 1000 / len(rows)
+            scores = retriever.score(variant_queries)[:, sample]
+
+            data.model, data.retriever = variant_model, retriever
+            ndcg = {Path(path).name: evaluate(data, path, ["two_tower"], k)["two_tower"][f"ndcg@{k}"] for path in val_paths}
+            report.append({
+                "precision": precision,
+                "quantized_towers": quantized_towers,
+                "embedding_mb": retriever.item_embeddings.nbytes / 2 ** 20,
+                "latency_ms": latency_ms,
+                "top_k_agreement": top_k_agreement(reference, results),
+                "rank_correlation": rank_correlation(reference_scores, scores),
+                "max_score_error": float(np.abs(scores - reference_scores).max()),
+                "ndcg": ndcg,
+                "ndcg_delta": {name: ndcg[name] - reference_ndcg[name] for name in ndcg},
+            })
+    data.model, data.retriever = model, reference_retriever
+    return report
+
+
+def main():
+    from evaluation import EvaluationData
+
+    parser = argparse.ArgumentParser(
+        description="Accuracy, memory and latency of quantized embeddings and towers against float32.")
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument("--towers", choices=["float32", "int8", "both"], default="both",
+                        help="Run the towers in float32, dynamically quantized int8, or compare both")
+    parser.add_argument("--val", nargs="*", default=sorted(config.DATA_DIR.glob('interactions_val*.csv')))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--users", type=int, default=2000, help="Users sampled for agreement and latency")
+    parser.add_argument("--recipes", type=int, default=10000, help="Recipes sampled for the score rank correlation")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    tower_options = {"float32": [False], "int8": [True], "both": [False, True]}[args.towers]
+    val_paths = [path for path in args.val if Path(path).exists()]
+    report = accuracy_report(EvaluationData(), args.precisions, tower_options, val_paths, args.k, args.users, args.recipes)
+
+    for row in report:
+        ndcg = "  ".join(f"{name} ndcg@{args.k}={row['ndcg'][name]:.4f} ({delta:+.4f})" for name, delta in row["ndcg_delta"].items())
+        towers = "int8" if row["quantized_towers"] else "float32"
+        print(f"embeddings={row['precision']:<8} towers={towers:<8} {row['embedding_mb']:8.2f} MB  "
+              f"{row['latency_ms']:.3f} ms/query  top-{args.k} agreement={row['top_k_agreement']:.4f}  "
+              f"rank corr={row['rank_correlation']:.4f}  max err={row['max_score_error']:.2e}  {ndcg}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import numpy as np
+
+
+def top_k_feasible_batch(scores, feasible, ks):
+    """
+    Per-row indices and scores of the k best feasible items, best first.
+    Infeasible items are masked to -inf before a partial selection, so
+    the cost per row is O(n + k log k) instead of a full sort.
+    """
+    masked = np.where(feasible, scores, -np.inf)
+    n_rows, n_items = masked.shape
+    n_feasible = np.count_nonzero(feasible, axis=1)
+    ks = [max(0, min(int(k), int(n))) for k, n in zip(ks, n_feasible)]
+
+    k_max = max(ks, default=0)
+    if k_max == 0:
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=masked.dtype))
+        return [empty] * n_rows
+
+    if k_max < n_items:
+        top = np.argpartition(-masked, k_max - 1, axis=1)[:, :k_max]
+    else:
+        top = np.broadcast_to(np.arange(n_items), (n_rows, n_items))
+    top_scores = np.take_along_axis(masked, top, axis=1)
+
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [(top[i, :k], top_scores[i, :k]) for i, k in enumerate(ks)]
+
+
+def top_k_feasible(scores, feasible, k):
+    return top_k_feasible_batch(scores[None, :], feasible[None, :], [k])[0]
@@ -1,5 +1,8 @@
 import ast
-import torch
+import json
+import numpy as np
+from numpy_engine import run_tower
+from metrics import stage, record_not_found
 
 def parse_json_column(data):
     if isinstance(data, str):
@@ -9,74 +12,163 @@ def parse_json_column(data):
             return [] if "[" in data else {}
     return data
 
-def is_recipe_available(row, user_products, user_equipment):
-    recipe_equip = set(parse_json_column(row.get('required_equipment', [])))
-    recipe_prods = set(parse_json_column(row.get('required_products', {})).keys())
-    
-    if not recipe_equip.issubset(set(user_equipment)):
-        return False
-        
-    if not recipe_prods.issubset(set(user_products)):
-        return False
-        
-    return True
-
-def get_recommendations(users_df, recipes_df, recipe_embeddings, model, user_id: str, k: int = 5):
-    user_rows = users_df[users_df['user_id'] == str(user_id)]
-    if user_rows.empty:
+def recipe_record(recipe):
+    return {
+        "recipe_id": str(recipe['recipe_id']),
+        "recipe_name": recipe.get('name', ""),
+        "description": recipe.get('description', ""),
+        "taste_bitterness": str(recipe['taste_bitterness']),
+        "taste_sweetness": str(recipe['taste_sweetness']),
+        "taste_acidity": str(recipe['taste_acidity']),
+        "taste_body": str(recipe['taste_body']),
+        "strength": str(recipe.get('strength', "")),
+        "portion_size_ml": str(recipe.get('portion_size_ml', "")),
+        "preparation_time_minutes": str(recipe.get('preparation_time_minutes', "")),
+        "difficulty": str(recipe.get('difficulty', "")),
+        "required_products": parse_json_column(recipe.get('required_products', {})),
+        "required_equipment": parse_json_column(recipe.get('required_equipment', [])),
+        "tags": parse_json_column(recipe.get('tags', [])),
+    }
+
+def user_record(user):
+    return {
+        "u_username": str(user['username']),
+        "u_owned_equipment": user['owned_equipment'],
+        "u_available_products": user['available_products'],
+        "u_taste_bitterness": str(user['taste_pref_bitterness']),
+        "u_taste_sweetness": str(user['taste_pref_sweetness']),
+        "u_taste_acidity": str(user['taste_pref_acidity']),
+        "u_taste_body": str(user['taste_pref_body']),
+        "u_preferred_strength": str(user['preferred_strength']),
+        "u_preferred_portion_size": str(user['preferred_portion_size']),
+        "u_dietary_restrictions": user['dietary_restrictions'],
+    }
+
+def recipe_record_v2(recipe):
+    return {
+        "recipe_id": str(recipe['recipe_id']),
+        "recipe_name": str(recipe.get('name', "")),
+        "description": str(recipe.get('description', "")),
+        "taste_bitterness": float(recipe['taste_bitterness']),
+        "taste_sweetness": float(recipe['taste_sweetness']),
+        "taste_acidity": float(recipe['taste_acidity']),
+        "taste_body": float(recipe['taste_body']),
+        "strength": int(recipe.get('strength', 0)),
+        "portion_size_ml": int(recipe.get('portion_size_ml', 0)),
+        "preparation_time_minutes": int(recipe.get('preparation_time_minutes', 0)),
+        "difficulty": str(recipe.get('difficulty', "")),
+        "required_products": parse_json_column(recipe.get('required_products', {})),
+        "required_equipment": parse_json_column(recipe.get('required_equipment', [])),
+        "tags": parse_json_column(recipe.get('tags', [])),
+    }
+
+def recipe_fragment(recipe):
+    """
+    Pre-serialized v2 recipe object left open before its score, so a
+    response is assembled by appending the score and closing brace.
+    """
+    encoded = json.dumps(recipe_record_v2(recipe), separators=(',', ':'))
+    return (encoded[:-1] + ',"score":').encode()
+
+def user_record_v2(user_id, user):
+    return {
+        "user_id": str(user_id),
+        "username": str(user['username']),
+        "owned_equipment": user['owned_equipment'],
+        "available_products": user['available_products'],
+        "taste_bitterness": float(user['taste_pref_bitterness']),
+        "taste_sweetness": float(user['taste_pref_sweetness']),
+        "taste_acidity": float(user['taste_pref_acidity']),
+        "taste_body": float(user['taste_pref_body']),
+        "preferred_strength": int(user['preferred_strength']),
+        "preferred_portion_size": str(user['preferred_portion_size']),
+        "dietary_restrictions": user['dietary_restrictions'],
+    }
+
+class TwoTowerRanker:
+    def __init__(self, model, retriever):
+        self.model = model
+        self.retriever = retriever
+
+    def rank(self, user_store, rows, ks):
+        with stage("user_tower"):
+            user_embs = run_tower(self.model.user_mlp, user_store.taste[rows])
+        with stage("retrieval"):
+            return self.retriever.search_batch(user_embs, user_store.masks[rows], ks)
+
+def rank_batch(user_store, ranker, requests):
+    """
+    requests: list of (user_id, k) pairs.
+    Returns (user row, top indices, top scores) per request, in order,
+    or None for users that are not in the store.
+    """
+    with stage("lookup"):
+        rows = [user_store.lookup(user_id) for user_id, _ in requests]
+        found = [i for i, row in enumerate(rows) if row is not None]
+    record_not_found(len(requests) - len(found))
+    results = [None] * len(requests)
+    if not found:
+        return results
+
+    found_rows = np.array([rows[i] for i in found])
+    with stage("rank"):
+        top = ranker.rank(user_store, found_rows, [requests[i][1] for i in found])
+
+    for i, row, (top_indices, top_scores) in zip(found, found_rows, top):
+        results[i] = (int(row), top_indices, top_scores)
+    return results
+
+def get_batch_recommendations(user_store, recipe_records, ranker, requests):
+    ranked = rank_batch(user_store, ranker, requests)
+
+    results = []
+    with stage("assemble"):
+        for ranking in ranked:
+            if ranking is None:
+                results.append(None)
+                continue
+            row, top_indices, top_scores = ranking
+            user = user_record(user_store.profiles[row])
+            results.append([
+                {**recipe_records[idx], **user, "score": float(score) * 5}
+                for idx, score in zip(top_indices, top_scores)
+            ])
+    return results
+
+def get_recommendations(user_store, recipe_records, ranker, user_id: str, k: int = 5):
+    return get_batch_recommendations(user_store, recipe_records, ranker, [(user_id, k)])[0]
+
+def get_fallback_recommendations(user_store, recipe_records, feasibility_index, cold_start_engine, user_id: str, k: int = 5):
+    """
+    The most popular recipes the user can make, from the precomputed
+    weighted-popularity order: one mask test per recipe and no model call.
+    """
+    row = user_store.lookup(user_id)
+    if row is None:
+        record_not_found()
+        return None
+    top_indices, top_scores = cold_start_engine.popular(k, feasibility_index.feasible(user_store.masks[row]))
+    user = user_record(user_store.profiles[row])
+    return [
+        {**recipe_records[idx], **user, "score": float(score)}
+        for idx, score in zip(top_indices, top_scores) if np.isfinite(score)
+    ]
+
+def encode_recipes(recipe_fragments, top_indices, scores):
+    return b'[' + b','.join(
+        recipe_fragments[idx] + repr(float(score)).encode() + b'}'
+        for idx, score in zip(top_indices, scores)
+    ) + b']'
+
+def encode_recommendations_v2(user_store, recipe_fragments, ranking, user_id):
+    row, top_indices, top_scores = ranking
+    user = json.dumps(user_record_v2(user_id, user_store.profiles[row]), separators=(',', ':')).encode()
+    recipes = encode_recipes(recipe_fragments, top_indices, top_scores * 5)
+    return b'{"user":' + user + b',"recipes":' + recipes + b'}'
+
+def get_recommendations_v2(user_store, recipe_fragments, ranker, user_id: str, k: int = 5):
+    ranking = rank_batch(user_store, ranker, [(user_id, k)])[0]
+    if ranking is None:
         return None
-    user_row = user_rows.iloc[0]
-
-    user_inventory = set(parse_json_column(user_row['available_products']))
-    user_equipment = set(parse_json_column(user_row['owned_equipment']))
-    
-    user_features = user_row[['taste_pref_bitterness', 'taste_pref_sweetness', 'taste_pref_acidity', 'taste_pref_body']].values.astype(float)
-    user_tensor = torch.tensor(user_features, dtype=torch.float32).unsqueeze(0)
-
-    with torch.no_grad():
-        user_emb = model.user_mlp(user_tensor) 
-        scores = (recipe_embeddings * user_emb).sum(dim=1)
-    
-    top_scores, top_indices = torch.sort(scores, descending=True)
-    
-    recommendations = []
-    for score, idx in zip(top_scores, top_indices):
-        if len(recommendations) >= k:
-            break
-            
-        idx = idx.item()
-        row = recipes_df.iloc[idx]
-        
-        if not is_recipe_available(row, user_inventory, user_equipment):
-            continue
-
-        recommendations.append({
-            "recipe_id": str(row['recipe_id']),
-            "recipe_name": row.get('name', ""),
-            "description": row.get('description', ""),
-            "taste_bitterness": str(row['taste_bitterness']),
-            "taste_sweetness": str(row['taste_sweetness']),
-            "taste_acidity": str(row['taste_acidity']),
-            "taste_body": str(row['taste_body']),
-            "strength": str(row.get('strength', "")),
-            "portion_size_ml": str(row.get('portion_size_ml', "")),
-            "preparation_time_minutes": str(row.get('preparation_time_minutes', "")),
-            "difficulty": str(row.get('difficulty', "")),
-            "required_products": parse_json_column(row.get('required_products', {})),
-            "required_equipment": parse_json_column(row.get('required_equipment', [])),
-            "tags": parse_json_column(row.get('tags', [])),
-            
-            "u_username": str(user_row['username']),
-            "u_owned_equipment": parse_json_column(user_row['owned_equipment']),
-            "u_available_products": parse_json_column(user_row['available_products']),
-            "u_taste_bitterness": str(user_row['taste_pref_bitterness']),
-            "u_taste_sweetness": str(user_row['taste_pref_sweetness']),
-            "u_taste_acidity": str(user_row['taste_pref_acidity']),
-            "u_taste_body": str(user_row['taste_pref_body']),
-            "u_preferred_strength": str(user_row['preferred_strength']),
-            "u_preferred_portion_size": str(user_row['preferred_portion_size']),
-            "u_dietary_restrictions": parse_json_column(user_row['dietary_restrictions']),
-            "score": float(score) * 5
-        })
-        
-    return recommendations
\ No newline at end of file
+    with stage("encode"):
+        return encode_recommendations_v2(user_store, recipe_fragments, ranking, user_id)
@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from metrics import record_cache
+
+
+class ResultCache:
+    """
+    Byte-bounded LRU cache of rankings keyed by (ranker, user_id). Each
+    entry remembers the catalog version and the user's feature state it
+    was computed from; a lookup under a different version or state drops
+    the entry. An entry computed for k also answers any smaller k.
+    """
+
+    # Rough per-entry cost of the key, tuple and OrderedDict node beyond the arrays.
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.counts = {"hit": 0, "miss": 0, "eviction": 0, "invalidation": 0}
+        self.rankers = set()
+
+    def _count(self, result, amount=1):
+        self.counts[result] += amount
+        record_cache(result, amount)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.nbytes -= entry[-1]
+
+    def get(self, key, version, state, k):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[0] != version or entry[1] != state):
+                self._remove(key)
+                self._count("invalidation")
+                entry = None
+            # Fewer results than the cached k means every feasible recipe is already there.
+            if entry is None or (entry[2] < k and len(entry[3]) >= entry[2]):
+                self._count("miss")
+                return None
+            self.entries.move_to_end(key)
+            self._count("hit")
+        return entry[3][:k], entry[4][:k]
+
+    def put(self, key, version, state, k, ranking):
+        # Rankers return views into per-batch arrays; copies keep the byte count honest.
+        indices, scores = (np.array(array) for array in ranking)
+        size = indices.nbytes + scores.nbytes + len(state) + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None:
+                if previous[0] == version and previous[1] == state and previous[2] >= k:
+                    return
+                self._remove(key)
+            self.entries[key] = (version, state, k, indices, scores, size)
+            self.nbytes += size
+            self.rankers.add(key[0])
+            evicted = 0
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                evicted += 1
+            if evicted:
+                self._count("eviction", evicted)
+
+    def invalidate(self, user_id):
+        """
+        Drops the user's entries for every ranker, for changes that are
+        not visible in the user's feature state.
+        """
+        with self.lock:
+            for ranker in self.rankers:
+                if (ranker, user_id) in self.entries:
+                    self._remove((ranker, user_id))
+                    self._count("invalidation")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            entries, nbytes = len(self.entries), self.nbytes
+        lookups = counts["hit"] + counts["miss"]
+        return {
+            "entries": entries,
+            "bytes": nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": counts["hit"],
+            "misses": counts["miss"],
+            "evictions": counts["eviction"],
+            "invalidations": counts["invalidation"],
+            "hit_rate": counts["hit"] / lookups if lookups else 0.0,
+        }
+
+
+def user_state(user_store, row):
+    """
+    The user features rankings depend on: taste, preferred strength and
+    the equipment/product bitmask.
+    """
+    return (np.asarray(user_store.taste[row]).tobytes() + np.asarray(user_store.strength[row]).tobytes()
+            + np.asarray(user_store.masks[row]).tobytes())
+
+
+class CachedRanker:
+    """
+    Answers rank() from a ResultCache and ranks only the missing users
+    with the wrapped ranker.
+    """
+
+    def __init__(self, cache, name, version, ranker):
+        self.cache = cache
+        self.name = name
+        self.version = version
+        self.ranker = ranker
+
+    def __getattr__(self, name):
+        # Everything but rank(), e.g. CollaborativeEngine.fold_in, goes to the wrapped ranker.
+        return getattr(self.ranker, name)
+
+    def rank(self, user_store, rows, ks):
+        keys = [(self.name, user_store.user_ids[row]) for row in rows]
+        states = [user_state(user_store, row) for row in rows]
+        results = [self.cache.get(key, self.version, state, k) for key, state, k in zip(keys, states, ks)]
+        missing = [i for i, ranking in enumerate(results) if ranking is None]
+        if not missing:
+            return results
+
+        ranked = self.ranker.rank(user_store, np.asarray(rows)[missing], [ks[i] for i in missing])
+        for i, ranking in zip(missing, ranked):
+            results[i] = ranking
+            self.cache.put(keys[i], self.version, states[i], ks[i], ranking)
+        return results
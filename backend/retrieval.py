@@ -0,0 +1,183 @@
+import argparse
+import time
+import numpy as np
+from ranking import top_k_feasible, top_k_feasible_batch
+from metrics import record_candidates
+from quantization import QuantizedEmbeddings, quantize_embeddings
+
+
+class ExactRetriever:
+    """
+    Brute-force maximum inner product search over every recipe embedding.
+    item_embeddings is a float32 array or QuantizedEmbeddings.
+    """
+
+    def __init__(self, item_embeddings, feasibility_index):
+        self.item_embeddings = item_embeddings
+        self.feasibility_index = feasibility_index
+
+    def score(self, queries):
+        if isinstance(self.item_embeddings, QuantizedEmbeddings):
+            return self.item_embeddings.dot(queries)
+        return queries @ self.item_embeddings.T
+
+    def search_batch(self, queries, user_masks, ks):
+        feasible = self.feasibility_index.feasible_batch(user_masks)
+        scores = self.score(queries)
+        record_candidates("exact", np.full(len(feasible), feasible.shape[1]), feasible.sum(axis=1))
+        return top_k_feasible_batch(scores, feasible, ks)
+
+
+def kmeans(points, n_clusters, n_iter=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), n_clusters, replace=False)].copy()
+    point_norms = (points ** 2).sum(axis=1)
+
+    for _ in range(n_iter):
+        distances = point_norms[:, None] - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+        assignment = distances.argmin(axis=1)
+
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Reseed empty clusters so every list keeps a share of the catalog.
+        centroids[empty] = points[rng.choice(len(points), int(empty.sum()), replace=False)]
+
+    return centroids, assignment
+
+
+class IVFIndex:
+    """
+    Inverted-file index for maximum inner product search: recipes are
+    grouped by k-means on their embeddings and a query scans only the
+    lists whose centroids score highest.
+
+    Feasibility is applied inside the search. Each list keeps the AND of
+    its recipes' requirement masks, so lists in which no recipe can be
+    feasible are skipped without scanning, and probing continues past
+    nprobe lists until k feasible recipes are found.
+
+    Clustering runs on float32; the reordered embeddings are then stored
+    at the given precision.
+    """
+
+    def __init__(self, item_embeddings, feasibility_index, n_lists=0, nprobe=4, n_iter=20, seed=0, precision="float32"):
+        n_items = len(item_embeddings)
+        if n_lists <= 0:
+            n_lists = max(1, int(np.sqrt(n_items)))
+        n_lists = min(n_lists, n_items)
+        self.nprobe = nprobe
+        self.feasibility_index = feasibility_index
+
+        item_embeddings = np.asarray(item_embeddings, dtype=np.float32)
+        self.centroids, assignment = kmeans(item_embeddings, n_lists, n_iter, seed)
+
+        order = np.argsort(assignment, kind='stable')
+        self.list_items = order
+        self.list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        self.list_offsets[1:] = np.cumsum(np.bincount(assignment, minlength=n_lists))
+        self.embeddings = quantize_embeddings(np.ascontiguousarray(item_embeddings[order]), precision)
+        self.masks = np.ascontiguousarray(feasibility_index.recipe_masks[order])
+
+        self.common_masks = np.zeros((n_lists, feasibility_index.n_words), dtype=np.uint64)
+        for i in range(n_lists):
+            start, end = self.list_offsets[i], self.list_offsets[i + 1]
+            if end > start:
+                self.common_masks[i] = np.bitwise_and.reduce(self.masks[start:end], axis=0)
+
+    def search(self, query, user_mask, k, nprobe=None):
+        nprobe = self.nprobe if nprobe is None else nprobe
+        reachable = ((self.common_masks & ~user_mask) == 0).all(axis=1)
+        lists = np.flatnonzero(reachable)
+        lists = lists[np.argsort(-(self.centroids[lists] @ query), kind='stable')]
+
+        candidates, n_feasible, n_scanned = [], 0, 0
+        for probed, list_id in enumerate(lists):
+            if probed >= nprobe and n_feasible >= k:
+                break
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            feasible = ((self.masks[start:end] & ~user_mask) == 0).all(axis=1)
+            positions = start + np.flatnonzero(feasible)
+            candidates.append(positions)
+            n_feasible += len(positions)
+            n_scanned += end - start
+        record_candidates("ivf", n_scanned, n_feasible)
+
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        positions = np.concatenate(candidates)
+        scores = self.embeddings[positions] @ query
+        top, top_scores = top_k_feasible(scores, np.ones(len(positions), dtype=bool), k)
+        return self.list_items[positions[top]], top_scores
+
+    def search_batch(self, queries, user_masks, ks, nprobe=None):
+        return [self.search(query, user_mask, k, nprobe) for query, user_mask, k in zip(queries, user_masks, ks)]
+
+
+def build_retriever(kind, item_embeddings, feasibility_index, n_lists=0, nprobe=4, precision="float32"):
+    if kind == "exact":
+        return ExactRetriever(quantize_embeddings(item_embeddings, precision), feasibility_index)
+    if kind == "ivf":
+        return IVFIndex(item_embeddings, feasibility_index, n_lists=n_lists, nprobe=nprobe, precision=precision)
+    raise ValueError(f"Unknown retrieval index {kind!r}, expected 'exact' or 'ivf'")
+
+
+def recall_report(index, exact, queries, user_masks, k=10, nprobes=(1, 2, 4, 8)):
+    """
+    Recall@k of the IVF index against the exact scorer, with mean
+    per-query latency, for each probe count.
+    """
+    start = time.perf_counter()
+    truth = [set(indices) for indices, _ in exact.search_batch(queries, user_masks, [k] * len(queries))]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    report = []
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        results = index.search_batch(queries, user_masks, [k] * len(queries), nprobe=nprobe)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        hits = sum(len(truth_set & set(indices)) for truth_set, (indices, _) in zip(truth, results))
+        total = sum(len(truth_set) for truth_set in truth)
+        report.append({
+            "nprobe": nprobe,
+            "recall": hits / total if total else 1.0,
+            "latency_ms": latency_ms,
+            "exact_latency_ms": exact_ms,
+        })
+    return report
+
+
+def main():
+    from load_data import load_model, load_df, load_recipe_embeddings, load_feasibility_index, load_user_store
+    from numpy_engine import run_tower
+
+    parser = argparse.ArgumentParser(description="Recall vs latency of the IVF index against exact scoring.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=0, help="0 picks sqrt(n_recipes)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    model = load_model()
+    users_df, recipes_df = load_df()
+    recipe_embeddings = load_recipe_embeddings(model, recipes_df)
+    feasibility_index = load_feasibility_index(recipes_df)
+    user_store = load_user_store(users_df, feasibility_index)
+
+    rows = np.arange(min(args.queries, len(user_store)))
+    queries = run_tower(model.user_mlp, user_store.taste[rows])
+    user_masks = user_store.masks[rows]
+
+    exact = ExactRetriever(recipe_embeddings, feasibility_index)
+    index = IVFIndex(recipe_embeddings, feasibility_index, n_lists=args.n_lists)
+    print(f"{len(index.list_offsets) - 1} lists over {len(recipe_embeddings)} recipes, {len(rows)} queries, k={args.k}")
+    for row in recall_report(index, exact, queries, user_masks, args.k, args.nprobe):
+        print(f"nprobe={row['nprobe']:<4} recall@{args.k}={row['recall']:.4f}  "
+              f"{row['latency_ms']:.3f} ms/query (exact {row['exact_latency_ms']:.3f} ms/query)")
+
+
+if __name__ == "__main__":
+    main()
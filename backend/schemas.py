@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Dict, Any, Optional
 
 class RecipeRecommendation(BaseModel):
     recipe_id: str
@@ -28,4 +28,74 @@ class RecipeRecommendation(BaseModel):
     u_preferred_portion_size: str
     u_dietary_restrictions: Any
 
-    score: float
\ No newline at end of file
+    score: float
+
+class BatchUserRequest(BaseModel):
+    user_id: str
+    k: int = 5
+
+class BatchPredictRequest(BaseModel):
+    users: List[BatchUserRequest] = Field(..., max_length=1000)
+    ranker: Optional[str] = None
+
+class BatchRecommendation(BaseModel):
+    user_id: str
+    found: bool
+    recommendations: List[RecipeRecommendation]
+
+class UserProfileV2(BaseModel):
+    user_id: str
+    username: str
+    owned_equipment: List[str]
+    available_products: List[str]
+    taste_bitterness: float
+    taste_sweetness: float
+    taste_acidity: float
+    taste_body: float
+    preferred_strength: int
+    preferred_portion_size: str
+    dietary_restrictions: List[str]
+
+class RecipeRecommendationV2(BaseModel):
+    recipe_id: str
+    recipe_name: str
+    description: str
+    taste_bitterness: float
+    taste_sweetness: float
+    taste_acidity: float
+    taste_body: float
+    strength: int
+    portion_size_ml: int
+    preparation_time_minutes: int
+    difficulty: str
+    required_products: Dict[str, str]
+    required_equipment: List[str]
+    tags: List[str]
+    score: float
+
+class RecommendationsV2(BaseModel):
+    user: UserProfileV2
+    recipes: List[RecipeRecommendationV2]
+
+class ColdStartRequest(BaseModel):
+    equipment: List[str] = []
+    products: List[str] = []
+    taste: Optional[List[float]] = Field(None, min_length=4, max_length=5)
+    k: int = 5
+
+    @field_validator("taste")
+    @classmethod
+    def strength_in_range(cls, taste):
+        if taste is not None and len(taste) == 5 and not 1 <= taste[4] <= 5:
+            raise ValueError("strength, the fifth taste value, must be on the 1-5 scale")
+        return taste
+
+class ColdStartRecommendations(BaseModel):
+    recipes: List[RecipeRecommendationV2]
+
+class InteractionIn(BaseModel):
+    recipe_id: str
+    rating: Optional[float] = None
+
+class FoldInRequest(BaseModel):
+    interactions: List[InteractionIn]
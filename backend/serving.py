@@ -0,0 +1,262 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from load_data import load_model, load_users_df, load_recipes_df, load_recipe_embeddings, load_feasibility_index, load_user_store, load_disk_user_store, load_recipe_records, load_recipe_fragments, load_content_engine, load_cold_start_engine
+from recommendations import TwoTowerRanker
+from snapshot import load_snapshot, read_manifest, stale_reason, model_path, DEFAULT_SOURCES
+from numpy_engine import run_tower
+from retrieval import build_retriever
+from content_based import ContentBasedEngine, RECIPE_FEATURES
+from cold_start import ColdStartEngine
+from ingestion import InteractionIngestor
+from collaborative import CollaborativeEngine
+from materialized import MaterializedRanker, open_fresh_table
+from result_cache import ResultCache, CachedRanker
+from interning import Interner
+import config
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def source_paths():
+    """
+    Files a bundle is built from; a change to any of them calls for a reload.
+    """
+    paths = [model_path(), config.CF_FACTORS,
+             config.TOPK_TABLE_DIR / 'manifest.json']
+    if config.SNAPSHOT_DIR:
+        paths.append(Path(config.SNAPSHOT_DIR) / 'manifest.json')
+    else:
+        paths.append(DEFAULT_SOURCES["recipes"])
+        if not config.USER_STORE_DIR:
+            paths.append(DEFAULT_SOURCES["users"])
+    if config.USER_STORE_DIR:
+        paths.append(Path(config.USER_STORE_DIR) / 'manifest.json')
+    return paths
+
+
+def source_mtimes():
+    return {str(path): path.stat().st_mtime_ns if path.exists() else None for path in (Path(p).resolve() for p in source_paths())}
+
+
+def catalog_version(sources):
+    """
+    Version of everything but the users file. Cached rankings stay valid
+    across reloads that keep it; changes to a user's own features are
+    caught per entry by the result cache.
+    """
+    user_paths = {str(Path(DEFAULT_SOURCES["users"]).resolve())}
+    if config.USER_STORE_DIR:
+        user_paths.add(str((Path(config.USER_STORE_DIR) / 'manifest.json').resolve()))
+    catalog = {path: mtime for path, mtime in sources.items() if path not in user_paths}
+    return hashlib.sha256(json.dumps(catalog, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class ServingBundle:
+    """
+    Model, user store, recipe catalog and rankers built together. A
+    request reads the current bundle once and uses only that bundle, so a
+    reload never mixes old and new data within a request and requests in
+    flight during a swap finish on the bundle they started with.
+    """
+
+    def __init__(self, model, user_store, feasibility_index, recipe_records, recipe_fragments, rankers,
+                 default_ranker, cold_start_engine, recipe_ids, ingestor=None, sources=None):
+        self.model = model
+        self.user_store = user_store
+        self.feasibility_index = feasibility_index
+        self.recipe_records = recipe_records
+        self.recipe_fragments = recipe_fragments
+        self.rankers = rankers
+        self.default_ranker = default_ranker
+        self.cold_start_engine = cold_start_engine
+        self.ingestor = ingestor
+        self.sources = sources or {}
+        self.recipe_ids = recipe_ids
+
+
+def build_bundle(ingestor=None, materialized=True, cache=None):
+    """
+    Loads everything from the configured sources. A running ingestor is
+    reused when the recipe catalog did not change, otherwise a new one is
+    restored from the checkpoint and caught up with the logs. With
+    materialized, a fresh top-k table replaces live scoring of its ranker
+    for the k it covers. With a ResultCache, every ranker answers from it
+    first.
+    """
+    sources = source_mtimes()
+    try:
+        model = load_model()
+    except (OSError, RuntimeError) as e:
+        logger.warning(f"Model weights could not be loaded ({e}), serving the content-based ranker only")
+        model = None
+
+    recipe_popularity = None
+    if config.SNAPSHOT_DIR:
+        (user_store, feasibility_index, recipe_records, recipe_fragments, recipe_embeddings, recipe_features,
+         recipe_popularity, recipe_ids) = load_snapshot(config.SNAPSHOT_DIR)
+        content_engine = ContentBasedEngine(recipe_features, feasibility_index)
+        # Only the model inputs are checked here; the data files are large and the launcher recompiles for them.
+        reason = stale_reason(read_manifest(config.SNAPSHOT_DIR), {"model": model_path()}) if model is not None else None
+        if reason is not None:
+            logger.warning(f"Snapshot embeddings in {config.SNAPSHOT_DIR} are stale ({reason}), recomputing them "
+                           f"from the loaded model")
+            recipe_embeddings = run_tower(model.item_mlp, np.ascontiguousarray(recipe_features[:, :len(RECIPE_FEATURES)]))
+    else:
+        recipes_df = load_recipes_df()
+        feasibility_index = load_feasibility_index(recipes_df)
+        user_store = None if config.USER_STORE_DIR else load_user_store(load_users_df(), feasibility_index)
+        recipe_records = load_recipe_records(recipes_df)
+        recipe_ids = Interner(recipes_df['recipe_id'].astype(str))
+        recipe_fragments = load_recipe_fragments(recipes_df)
+        content_engine = load_content_engine(recipes_df, feasibility_index)
+        recipe_embeddings = load_recipe_embeddings(model, recipes_df) if model is not None else None
+    if config.USER_STORE_DIR:
+        user_store = load_disk_user_store(feasibility_index)
+
+    rankers = {"content_based": content_engine}
+    if model is not None:
+        retriever = build_retriever(config.RETRIEVAL, recipe_embeddings, feasibility_index, config.IVF_LISTS,
+                                    config.IVF_NPROBE, config.EMBEDDING_PRECISION)
+        rankers["two_tower"] = TwoTowerRanker(model, retriever)
+    if config.CF_FACTORS.exists():
+        rankers["collaborative"] = CollaborativeEngine.load(config.CF_FACTORS, recipe_ids, feasibility_index, fallback=content_engine,
+                                                            foldin_log=config.CF_FOLDIN_LOG)
+    default_ranker = config.RANKER if config.RANKER in rankers else "content_based"
+
+    if materialized and (config.TOPK_TABLE_DIR / 'manifest.json').exists():
+        table, reason = open_fresh_table(config.TOPK_TABLE_DIR, rankers, len(user_store), len(recipe_ids))
+        if table is None:
+            logger.warning(f"Top-k table in {config.TOPK_TABLE_DIR} is not used ({reason}), scoring live")
+        else:
+            rankers[table.ranker] = MaterializedRanker(table, rankers[table.ranker])
+            logger.info(f"Serving top-{table.k} {table.ranker} recommendations from {config.TOPK_TABLE_DIR}")
+
+    if cache is not None:
+        version = catalog_version(sources)
+        rankers = {name: CachedRanker(cache, name, version, ranker) for name, ranker in rankers.items()}
+
+    if config.INGEST_ENABLED:
+        if ingestor is None or list(ingestor.recipe_ids) != list(recipe_ids):
+            ingestor = InteractionIngestor(recipe_ids, content_engine.recipe_features, config.INGEST_PATTERNS,
+                                           checkpoint_path=config.INGEST_CHECKPOINT)
+            ingestor.restore()
+            ingestor.poll()
+        cold_start_engine = ColdStartEngine(ingestor.popularity(), content_engine)
+    elif recipe_popularity is not None:
+        ingestor = None
+        cold_start_engine = ColdStartEngine(recipe_popularity, content_engine)
+    else:
+        ingestor = None
+        cold_start_engine = load_cold_start_engine(config.INTERACTIONS_PATHS, recipe_ids, content_engine)
+
+    return ServingBundle(model, user_store, feasibility_index, recipe_records, recipe_fragments, rankers,
+                         default_ranker, cold_start_engine, recipe_ids, ingestor, sources)
+
+
+class ServingState:
+    """
+    Holds the current ServingBundle. reload() builds a new bundle on the
+    calling thread while the old one keeps serving, then publishes it with
+    a single reference assignment. Only one reload runs at a time.
+    """
+
+    def __init__(self, builder=build_bundle, cache_bytes=0):
+        self.builder = builder
+        # Shared by successive bundles; entries are checked against each bundle's catalog version.
+        self.cache = ResultCache(cache_bytes) if cache_bytes > 0 else None
+        self.bundle = None
+        self.generation = 0
+        self.reload_lock = threading.Lock()
+        self.ingest_stop = None
+        self.last_reload = None
+        self.last_error = None
+
+    def reload(self, reason="manual"):
+        """
+        Returns the timings of the reload, or None when another reload is
+        already running. The old bundle stays in place if the build fails.
+        """
+        if not self.reload_lock.acquire(blocking=False):
+            return None
+        try:
+            start = time.perf_counter()
+            old = self.bundle
+            try:
+                bundle = self.builder(old.ingestor if old is not None else None, cache=self.cache)
+            except Exception as e:
+                self.last_error = {"reason": reason, "error": repr(e), "at": time.time()}
+                raise
+            built = time.perf_counter()
+
+            self.bundle = bundle
+            self.generation += 1
+            swapped = time.perf_counter()
+
+            if bundle.ingestor is not (old.ingestor if old is not None else None):
+                if self.ingest_stop is not None:
+                    self.ingest_stop.set()
+                self.ingest_stop = None
+                if bundle.ingestor is not None:
+                    self.ingest_stop, _ = bundle.ingestor.start(config.INGEST_INTERVAL, config.INGEST_CHECKPOINT_INTERVAL,
+                                                                on_update=self._on_ingest)
+
+            self.last_error = None
+            self.last_reload = {
+                "generation": self.generation,
+                "reason": reason,
+                "at": time.time(),
+                "build_seconds": built - start,
+                "swap_seconds": swapped - built,
+                "rankers": sorted(bundle.rankers),
+                "n_users": len(bundle.user_store),
+                "n_recipes": len(bundle.recipe_ids),
+            }
+            return self.last_reload
+        finally:
+            self.reload_lock.release()
+
+    def _on_ingest(self, ingestor):
+        bundle = self.bundle
+        if bundle.ingestor is ingestor:
+            bundle.cold_start_engine.update_popularity(ingestor.popularity())
+
+    def watch(self, stop_event, interval=10.0):
+        """
+        Reloads whenever a source file changed and then stayed unchanged
+        for a whole interval, so a file that is still being copied is not
+        picked up half written.
+        """
+        pending = None
+        while not stop_event.wait(interval):
+            current = source_mtimes()
+            changed = [path for path, mtime in current.items() if self.bundle.sources.get(path) != mtime]
+            if not changed or current != pending:
+                pending = current if changed else None
+                continue
+            pending = None
+            try:
+                timings = self.reload(reason=f"changed: {', '.join(changed)}")
+            except Exception:
+                logger.exception("Reload failed, still serving the previous bundle")
+                continue
+            if timings is not None:
+                logger.info(f"Reloaded generation {timings['generation']} in {timings['build_seconds']:.2f}s")
+
+    def start_watcher(self, interval=10.0):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self.watch, args=(stop_event, interval), name="bundle-watcher", daemon=True)
+        thread.start()
+        return stop_event, thread
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "reloading": self.reload_lock.locked(),
+            "last_reload": self.last_reload,
+            "last_error": self.last_error,
+        }
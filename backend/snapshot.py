@@ -0,0 +1,270 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from pathlib import Path
+from feasibility import FeasibilityIndex
+from user_store import UserStore
+from recommendations import recipe_record, recipe_fragment
+from content_based import recipe_feature_matrix
+from cold_start import weighted_ratings
+from interning import Interner, SortedIds, sort_ids
+import config
+
+FORMAT_VERSION = 4
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_SOURCES = {
+    "users": config.DATA_DIR / 'users.csv',
+    "recipes": config.DATA_DIR / 'recipes.csv',
+    "model": BASE_DIR / 'model_weights.pth',
+}
+
+
+def _save(path, array):
+    """
+    Writes to a temporary file and renames it over path. Workers that have
+    the previous file memory-mapped keep reading the old inode instead of
+    faulting on a truncated one.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class StringTable:
+    """
+    Variable-length byte strings stored as one uint8 blob plus an int64
+    offsets array, both memory-mappable.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @staticmethod
+    def write(path, items):
+        items = list(items)
+        offsets = np.zeros(len(items) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in items])
+        _save(f"{path}.offsets.npy", offsets)
+        _save(f"{path}.blob.npy", np.frombuffer(b''.join(items), dtype=np.uint8))
+
+    @classmethod
+    def open(cls, path, mmap_mode='r'):
+        return cls(np.load(f"{path}.blob.npy", mmap_mode=mmap_mode),
+                   np.load(f"{path}.offsets.npy", mmap_mode=mmap_mode))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class JsonTable(StringTable):
+    def __getitem__(self, i):
+        return json.loads(super().__getitem__(i))
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_path():
+    """
+    The weights file load_model() reads with the configured engine.
+    """
+    return config.NUMPY_WEIGHTS if config.ENGINE == "numpy" else DEFAULT_SOURCES["model"]
+
+
+def snapshot_sources():
+    """
+    Every file a snapshot is compiled from: users, recipes, the served
+    weights and the interaction logs behind the popularity scores.
+    """
+    interactions = {f"interactions/{Path(path).name}": Path(path)
+                    for path in config.INTERACTIONS_PATHS if path and Path(path).exists()}
+    return {**DEFAULT_SOURCES, "model": model_path(), **interactions}
+
+
+def embedding_settings():
+    """
+    Configuration that changes the recipe embeddings computed from the
+    same weights file.
+    """
+    return {"engine": config.ENGINE, "quantize_towers": config.QUANTIZE_TOWERS}
+
+
+def data_version(fingerprints):
+    return hashlib.sha256(json.dumps(fingerprints, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _encode_json(value):
+    return json.dumps(value, separators=(',', ':'), default=str).encode()
+
+
+def compile_snapshot(out_dir, model, users_df, recipes_df, sources=None):
+    """
+    model must be the one load_model() returns for the current
+    configuration; its weights file and settings are recorded so stale
+    embeddings can be detected.
+    """
+    from load_data import load_recipe_embeddings, load_interaction_codes
+
+    sources = snapshot_sources() if sources is None else sources
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    feasibility_index = FeasibilityIndex.from_recipes(recipes_df)
+    user_store = UserStore.from_users_df(users_df, feasibility_index)
+    recipe_embeddings = load_recipe_embeddings(model, recipes_df)
+    recipes = recipes_df.to_dict('records')
+    recipe_ids = Interner(recipes_df['recipe_id'].astype(str))
+    interaction_paths = [path for name, path in sources.items() if name.startswith("interactions/")]
+    _, recipe_idx, ratings = load_interaction_codes(interaction_paths, recipe_ids)
+    known = recipe_idx >= 0
+    user_ids = np.array([user_id.encode() for user_id in user_store.user_ids], dtype=np.bytes_)
+    sorted_ids, sorted_rows = sort_ids(user_ids)
+    recipe_id_bytes = np.array([recipe_id.encode() for recipe_id in recipe_ids], dtype=np.bytes_)
+    recipe_sorted_ids, recipe_sorted_rows = sort_ids(recipe_id_bytes)
+
+    _save(out_dir / 'user_taste.npy', user_store.taste)
+    _save(out_dir / 'user_strength.npy', user_store.strength)
+    _save(out_dir / 'user_masks.npy', user_store.masks)
+    _save(out_dir / 'recipe_masks.npy', feasibility_index.recipe_masks)
+    _save(out_dir / 'recipe_embeddings.npy', np.ascontiguousarray(recipe_embeddings, dtype=np.float32))
+    _save(out_dir / 'recipe_features.npy', recipe_feature_matrix(recipes_df))
+    _save(out_dir / 'recipe_popularity.npy', weighted_ratings(recipe_idx[known], ratings[known], len(recipe_ids)))
+    _save(out_dir / 'user_sorted_ids.npy', sorted_ids)
+    _save(out_dir / 'user_sorted_rows.npy', sorted_rows)
+    _save(out_dir / 'recipe_sorted_ids.npy', recipe_sorted_ids)
+    _save(out_dir / 'recipe_sorted_rows.npy', recipe_sorted_rows)
+
+    StringTable.write(out_dir / 'user_ids', user_ids)
+    StringTable.write(out_dir / 'recipe_ids', recipe_id_bytes)
+    StringTable.write(out_dir / 'user_profiles', (_encode_json(profile) for profile in user_store.profiles))
+    StringTable.write(out_dir / 'recipe_records', (_encode_json(recipe_record(recipe)) for recipe in recipes))
+    StringTable.write(out_dir / 'recipe_fragments', (recipe_fragment(recipe) for recipe in recipes))
+
+    fingerprints = {name: file_fingerprint(path) for name, path in sources.items()}
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "data_version": data_version(fingerprints),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "sources": fingerprints,
+        "settings": embedding_settings(),
+        "n_users": len(user_store),
+        "n_recipes": len(recipes),
+        "embedding_dim": int(recipe_embeddings.shape[1]),
+        "equipment_vocab": feasibility_index.equipment_vocab,
+        "product_vocab": feasibility_index.product_vocab,
+    }
+    # The manifest is written last so a half-written snapshot never loads.
+    with open(out_dir / 'manifest.json.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(out_dir / 'manifest.json.tmp', out_dir / 'manifest.json')
+    return manifest
+
+
+def read_manifest(snapshot_dir):
+    with open(Path(snapshot_dir) / 'manifest.json') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Snapshot format {manifest.get('format_version')} is not supported, expected {FORMAT_VERSION}")
+    return manifest
+
+
+def stale_reason(manifest, sources=None):
+    """
+    None when the snapshot was compiled from the current contents of
+    sources (all inputs by default) and the current embedding settings,
+    otherwise what changed.
+    """
+    sources = snapshot_sources() if sources is None else sources
+    changed = sorted(name for name, path in sources.items() if manifest["sources"].get(name) != file_fingerprint(path))
+    if changed:
+        return f"{', '.join(changed)} changed"
+    if manifest.get("settings") != embedding_settings():
+        return "embedding settings changed"
+    return None
+
+
+def is_current(snapshot_dir, sources=None):
+    """
+    True when snapshot_dir holds a snapshot compiled from the current
+    contents of sources and the current embedding settings.
+    """
+    try:
+        manifest = read_manifest(snapshot_dir)
+    except (OSError, ValueError):
+        return False
+    return stale_reason(manifest, sources) is None
+
+
+def load_snapshot(snapshot_dir):
+    """
+    Returns (user_store, feasibility_index, recipe_records, recipe_fragments,
+    recipe_embeddings, recipe_features, recipe_popularity, recipe_ids)
+    backed by memory-mapped arrays. User and recipe ids are looked up by
+    bisection over mapped sorted id arrays rather than decoded into a
+    per-worker index.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    manifest = read_manifest(snapshot_dir)
+
+    feasibility_index = FeasibilityIndex(
+        manifest["equipment_vocab"], manifest["product_vocab"],
+        np.load(snapshot_dir / 'recipe_masks.npy', mmap_mode='r'),
+    )
+    user_ids = SortedIds(StringTable.open(snapshot_dir / 'user_ids'),
+                         np.load(snapshot_dir / 'user_sorted_ids.npy', mmap_mode='r'),
+                         np.load(snapshot_dir / 'user_sorted_rows.npy', mmap_mode='r'))
+    user_store = UserStore(
+        user_ids,
+        np.load(snapshot_dir / 'user_taste.npy', mmap_mode='r'),
+        np.load(snapshot_dir / 'user_strength.npy', mmap_mode='r'),
+        np.load(snapshot_dir / 'user_masks.npy', mmap_mode='r'),
+        JsonTable.open(snapshot_dir / 'user_profiles'),
+    )
+    recipe_records = JsonTable.open(snapshot_dir / 'recipe_records')
+    recipe_fragments = StringTable.open(snapshot_dir / 'recipe_fragments')
+    recipe_embeddings = np.load(snapshot_dir / 'recipe_embeddings.npy', mmap_mode='r')
+    recipe_features = np.load(snapshot_dir / 'recipe_features.npy', mmap_mode='r')
+    recipe_popularity = np.load(snapshot_dir / 'recipe_popularity.npy', mmap_mode='r')
+    recipe_ids = SortedIds(StringTable.open(snapshot_dir / 'recipe_ids'),
+                           np.load(snapshot_dir / 'recipe_sorted_ids.npy', mmap_mode='r'),
+                           np.load(snapshot_dir / 'recipe_sorted_rows.npy', mmap_mode='r'))
+
+    return (user_store, feasibility_index, recipe_records, recipe_fragments, recipe_embeddings, recipe_features,
+            recipe_popularity, recipe_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the serving data into a memory-mappable snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compile_parser = subparsers.add_parser("compile")
+    compile_parser.add_argument("--out", required=True, help="Snapshot directory to write")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        from load_data import load_model, load_df
+
+        start = time.perf_counter()
+        users_df, recipes_df = load_df()
+        manifest = compile_snapshot(args.out, load_model(), users_df, recipes_df)
+        print(f"Snapshot {manifest['data_version']} with {manifest['n_users']} users and "
+              f"{manifest['n_recipes']} recipes written to {args.out} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
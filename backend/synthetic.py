@@ -0,0 +1,333 @@
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+SYNTHETIC_DIR = BASE_DIR / '../synthetic'
+
+# (users, recipes) per preset; "small" matches student_data.
+SIZES = {
+    "small": (2_000, 150),
+    "medium": (100_000, 10_000),
+    "large": (1_000_000, 100_000),
+    "xlarge": (10_000_000, 1_000_000),
+}
+
+# Ordered from most to least commonly owned/required; the first entries of
+# each list are what every user has, as in student_data.
+EQUIPMENT = [
+    "kettle", "grinder", "espresso_machine", "scale", "milk_frother", "french_press", "pour_over", "moka_pot",
+    "blender", "ice_maker", "cold_brew_maker", "aeropress", "drip_machine", "gooseneck_kettle", "hand_grinder",
+    "chemex", "milk_thermometer", "tamper", "knock_box", "pod_machine", "siphon", "cezve", "phin_filter",
+    "cocktail_shaker", "nitro_keg", "steam_wand", "refractometer", "roaster",
+]
+ALWAYS_OWNED = 1
+PRODUCTS = [
+    "water", "sugar", "ground_coffee", "coffee_beans", "whole_milk", "oat_milk", "almond_milk", "ice", "skim_milk",
+    "honey", "coconut_milk", "cocoa_powder", "whipped_cream", "vanilla_syrup", "chocolate_syrup", "hazelnut_syrup",
+    "brown_sugar", "caramel_syrup", "cinnamon", "heavy_cream", "soy_milk", "cashew_milk", "condensed_milk",
+    "half_and_half", "maple_syrup", "agave_syrup", "stevia", "nutmeg", "cardamom", "ginger", "pumpkin_spice",
+    "mint_syrup", "lavender_syrup", "irish_cream_syrup", "toffee_syrup", "white_chocolate", "matcha_powder",
+    "decaf_beans", "cold_brew_concentrate", "orange_zest", "sea_salt", "butter", "egg_yolk", "coconut_cream",
+    "evaporated_milk", "star_anise", "cherry_syrup", "rum_extract",
+]
+ALWAYS_AVAILABLE = 3
+LIQUID_SUFFIXES = ("milk", "syrup", "water", "cream", "concentrate", "half_and_half", "extract")
+TAGS = ["hot", "specialty", "classic", "iced", "quick", "low_caffeine", "high_caffeine", "sugar_free", "vegan",
+        "seasonal", "blended"]
+STYLES = ["espresso", "americano", "latte", "cappuccino", "flat_white", "mocha", "macchiato", "cortado",
+          "cold_brew", "iced_coffee", "frappe", "affogato", "pour_over", "french_press_coffee", "moka_pot_coffee"]
+VARIANTS = ["", "double", "large", "iced", "with_cinnamon", "sugar-free", "decaf", "vanilla", "caramel", "oat",
+            "spiced", "honey", "coconut", "hazelnut"]
+USERNAME_PREFIXES = ["coffee_fan", "coffee_master", "bean_lover", "espresso_enthusiast", "latte_artist", "brew_geek"]
+
+
+def vocabulary(base, size):
+    """
+    The first size names of base, extended with numbered variants when
+    more are asked for.
+    """
+    names = list(base[:size])
+    i = 2
+    while len(names) < size:
+        names += [f"{name}_{i}" for name in base[:size - len(names)]]
+        i += 1
+    return names
+
+
+def zipf_weights(n, exponent=1.0):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def sample_subsets(rng, weights, sizes):
+    """
+    One subset of vocabulary indices per row, of the given sizes, drawn
+    without replacement in proportion to weights (Gumbel top-k).
+    """
+    keys = np.log(weights)[None, :] + rng.gumbel(size=(len(sizes), len(weights)))
+    order = np.argsort(-keys, axis=1)
+    chosen = np.zeros(keys.shape, dtype=bool)
+    take = np.arange(len(weights))[None, :] < sizes[:, None]
+    np.put_along_axis(chosen, order, take, axis=1)
+    return chosen
+
+
+def format_lists(chosen, quoted):
+    rows, cols = np.nonzero(chosen)
+    splits = np.split(cols, np.cumsum(np.bincount(rows, minlength=len(chosen)))[:-1])
+    return ['[' + ', '.join(quoted[j] for j in items) + ']' for items in splits]
+
+
+def pack(chosen):
+    return np.packbits(chosen, axis=1, bitorder='little')
+
+
+class SyntheticDataset:
+    """
+    Writes users.csv, recipes.csv, interactions_{train,val,val_cold}.csv
+    and cold_users.json with the student_data schema. Rows are generated
+    in chunks so sizes far beyond memory-resident DataFrames work;
+    requirement/ownership bitsets are kept to sample only feasible
+    interactions.
+    """
+
+    def __init__(self, n_users, n_recipes, n_equipment=len(EQUIPMENT), n_products=len(PRODUCTS),
+                 interactions_per_user=5.0, cold_fraction=0.1, seed=0, chunk_size=100_000):
+        self.n_users = n_users
+        self.n_recipes = n_recipes
+        self.equipment = vocabulary(EQUIPMENT, n_equipment)
+        self.products = vocabulary(PRODUCTS, n_products)
+        self.interactions_per_user = interactions_per_user
+        self.cold_fraction = cold_fraction
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+
+        self.recipe_ids = None
+        self.recipe_taste = None
+        self.recipe_requirements = None
+        self.recipe_popularity = None
+        self.user_taste = None
+        self.user_inventory = None
+
+    def _chunks(self, n):
+        for start in range(0, n, self.chunk_size):
+            yield start, min(start + self.chunk_size, n)
+
+    @staticmethod
+    def _write(df, path, first):
+        df.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+
+    def write_recipes(self, path):
+        rng = self.rng
+        n_eq, n_pr = len(self.equipment), len(self.products)
+        # Recipes rarely need the pantry staples, so requirement popularity skips the always-owned items.
+        eq_weights = zipf_weights(n_eq, 0.8)
+        pr_weights = np.concatenate([[1e-3] * ALWAYS_AVAILABLE, zipf_weights(n_pr - ALWAYS_AVAILABLE, 0.9)])
+        pr_weights /= pr_weights.sum()
+        quoted_eq = [json.dumps(name) for name in self.equipment]
+        quoted_tags = [json.dumps(name) for name in TAGS]
+        tag_weights = zipf_weights(len(TAGS), 0.7)
+        units = ["ml" if name.endswith(LIQUID_SUFFIXES) else "g" for name in self.products]
+
+        self.recipe_ids = []
+        self.recipe_taste = np.empty((self.n_recipes, 4), dtype=np.float32)
+        self.recipe_requirements = np.empty((self.n_recipes, (n_eq + n_pr + 7) // 8), dtype=np.uint8)
+        for start, end in self._chunks(self.n_recipes):
+            n = end - start
+            idx = np.arange(start, end)
+            styles = rng.integers(0, len(STYLES), n)
+            variants = rng.integers(0, len(VARIANTS), n)
+            slugs = [STYLES[s] + ('_' + VARIANTS[v] if VARIANTS[v] else '') for s, v in zip(styles, variants)]
+            recipe_ids = [f"recipe_{slug}_{i:03d}" for slug, i in zip(slugs, idx)]
+            names = [slug.replace('_', ' ').title() for slug in slugs]
+
+            equipment = sample_subsets(rng, eq_weights, rng.choice([1, 2, 3], n, p=[0.45, 0.4, 0.15]))
+            products = sample_subsets(rng, pr_weights, rng.choice([1, 2, 3, 4], n, p=[0.35, 0.35, 0.2, 0.1]))
+            tags = sample_subsets(rng, tag_weights, rng.integers(1, 5, n))
+            amounts = rng.integers(1, 25, products.shape) * 10
+            rows, cols = np.nonzero(products)
+            splits = np.split(cols, np.cumsum(np.bincount(rows, minlength=n))[:-1])
+            required_products = [
+                json.dumps({self.products[j]: f"{amounts[r, j]}{units[j]}" for j in items})
+                for r, items in enumerate(splits)
+            ]
+
+            taste = np.round(rng.uniform(0.05, 0.95, (n, 4)), 2)
+            self.recipe_ids += recipe_ids
+            self.recipe_taste[start:end] = taste
+            self.recipe_requirements[start:end] = pack(np.hstack([equipment, products]))
+
+            self._write(pd.DataFrame({
+                "recipe_id": recipe_ids,
+                "name": names,
+                "description": [f"A {name.lower()} prepared with care." for name in names],
+                "taste_bitterness": taste[:, 0],
+                "taste_sweetness": taste[:, 1],
+                "taste_acidity": taste[:, 2],
+                "taste_body": taste[:, 3],
+                "strength": rng.integers(1, 6, n),
+                "portion_size_ml": rng.choice([30, 60, 120, 180, 240, 300, 350, 450], n),
+                "preparation_time_minutes": rng.integers(1, 21, n),
+                "difficulty": rng.choice(["beginner", "intermediate", "advanced"], n, p=[0.3, 0.63, 0.07]),
+                "required_equipment": format_lists(equipment, quoted_eq),
+                "required_products": required_products,
+                "tags": format_lists(tags, quoted_tags),
+            }), path, start == 0)
+
+        # A few recipes get most of the traffic, as in the real logs.
+        self.recipe_popularity = zipf_weights(self.n_recipes, 0.8)[rng.permutation(self.n_recipes)]
+
+    def write_users(self, path):
+        rng = self.rng
+        n_eq, n_pr = len(self.equipment), len(self.products)
+        eq_probs = np.concatenate([[1.0] * ALWAYS_OWNED, 0.8 * np.arange(1, n_eq - ALWAYS_OWNED + 1) ** -0.6])
+        pr_probs = np.concatenate([[1.0] * ALWAYS_AVAILABLE, 0.8 * np.arange(1, n_pr - ALWAYS_AVAILABLE + 1) ** -0.3])
+        quoted_eq = [json.dumps(name) for name in self.equipment]
+        quoted_pr = [json.dumps(name) for name in self.products]
+        width = max(5, len(str(self.n_users - 1)))
+        created = np.datetime64('2023-01-01') + rng.integers(0, 730, self.n_users)
+
+        self.user_taste = np.empty((self.n_users, 4), dtype=np.float32)
+        self.user_inventory = np.empty((self.n_users, self.recipe_requirements.shape[1]), dtype=np.uint8)
+        for start, end in self._chunks(self.n_users):
+            n = end - start
+            idx = np.arange(start, end)
+            equipment = rng.random((n, n_eq)) < eq_probs
+            products = rng.random((n, n_pr)) < pr_probs
+            taste = rng.uniform(0, 1, (n, 4))
+            restrictions = rng.choice(['[]', '["sugar_free"]', '["dairy_free"]'], n, p=[0.8, 0.1, 0.1])
+            self.user_taste[start:end] = taste
+            self.user_inventory[start:end] = pack(np.hstack([equipment, products]))
+
+            self._write(pd.DataFrame({
+                "user_id": [f"user_{i:0{width}d}" for i in idx],
+                "username": [f"{USERNAME_PREFIXES[i % len(USERNAME_PREFIXES)]}_{i}" for i in idx],
+                "owned_equipment": format_lists(equipment, quoted_eq),
+                "available_products": format_lists(products, quoted_pr),
+                "taste_pref_bitterness": taste[:, 0],
+                "taste_pref_sweetness": taste[:, 1],
+                "taste_pref_acidity": taste[:, 2],
+                "taste_pref_body": taste[:, 3],
+                "preferred_strength": rng.choice([1, 2, 3, 4, 5], n, p=[0.2, 0.4, 0.25, 0.1, 0.05]),
+                "preferred_portion_size": rng.choice(["small", "medium", "large"], n, p=[0.25, 0.25, 0.5]),
+                "dietary_restrictions": restrictions,
+                "account_created": [f"{day}T00:00:00" for day in created[start:end]],
+            }), path, start == 0)
+        return width
+
+    def write_interactions(self, out_dir, width, rounds=24):
+        """
+        Feasible (user, recipe) pairs drawn by recipe popularity, rated by
+        taste distance plus noise, ~40% of ratings missing. Pairs after
+        the time cutoff go to validation; cold users only have validation
+        interactions.
+        """
+        rng = self.rng
+        paths = {name: out_dir / f"interactions_{name}.csv" for name in ("train", "val", "val_cold")}
+        cold = rng.random(self.n_users) < self.cold_fraction
+        first = {name: True for name in paths}
+        period = np.timedelta64(365 * 24 * 3600, 's')
+        cutoff = np.datetime64('2024-01-01T00:00:00') + period * 8 // 10
+        cdf = np.cumsum(self.recipe_popularity)
+        n_written = 0
+
+        for start, end in self._chunks(self.n_users):
+            counts = rng.negative_binomial(2, 2 / (2 + self.interactions_per_user), end - start)
+            users = np.repeat(np.arange(start, end), counts)
+            recipes = np.full(len(users), -1, dtype=np.int64)
+            for _ in range(rounds):
+                todo = np.flatnonzero(recipes < 0)
+                if not len(todo):
+                    break
+                candidates = np.minimum(np.searchsorted(cdf, rng.random(len(todo)) * cdf[-1]), self.n_recipes - 1)
+                missing = self.recipe_requirements[candidates] & ~self.user_inventory[users[todo]]
+                feasible = ~missing.any(axis=1)
+                recipes[todo[feasible]] = candidates[feasible]
+            keep = recipes >= 0
+            users, recipes = users[keep], recipes[keep]
+
+            distance = np.linalg.norm(self.user_taste[users] - self.recipe_taste[recipes], axis=1)
+            ratings = np.clip(np.round((5 - 4 * distance / 2 + rng.normal(0, 0.6, len(users))) * 2) / 2, 1.0, 5.0)
+            ratings[rng.random(len(users)) < 0.4] = np.nan
+            timestamps = np.datetime64('2024-01-01T00:00:00') + rng.integers(0, int(period / np.timedelta64(1, 's')), len(users)).astype('timedelta64[s]')
+            split = np.where(cold[users], 'val_cold', np.where(timestamps < cutoff, 'train', 'val'))
+
+            df = pd.DataFrame({
+                "interaction_id": [f"int_{i:07d}" for i in range(n_written, n_written + len(users))],
+                "user_id": [f"user_{u:0{width}d}" for u in users],
+                "recipe_id": [self.recipe_ids[r] for r in recipes],
+                "timestamp": timestamps.astype(str),
+                "rating": ratings,
+                "completed": rng.random(len(users)) < 0.92,
+            })
+            n_written += len(users)
+            for name, path in paths.items():
+                part = df[split == name]
+                if len(part) or first[name]:
+                    self._write(part, path, first[name])
+                    first[name] = False
+
+        with open(out_dir / 'cold_users.json', 'w') as f:
+            json.dump([f"user_{u:0{width}d}" for u in np.flatnonzero(cold)], f)
+        return n_written
+
+    def write(self, out_dir):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        self.write_recipes(out_dir / 'recipes.csv')
+        width = self.write_users(out_dir / 'users.csv')
+        n_interactions = self.write_interactions(out_dir, width)
+
+        params = {
+            "n_users": self.n_users,
+            "n_recipes": self.n_recipes,
+            "n_equipment": len(self.equipment),
+            "n_products": len(self.products),
+            "interactions_per_user": self.interactions_per_user,
+            "cold_fraction": self.cold_fraction,
+            "seed": self.seed,
+            "n_interactions": n_interactions,
+            "seconds": time.perf_counter() - start,
+        }
+        with open(out_dir / 'synthetic.json', 'w') as f:
+            json.dump(params, f, indent=2)
+        return params
+
+
+def read_params(out_dir):
+    path = Path(out_dir) / 'synthetic.json'
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset with the student_data schema.")
+    parser.add_argument("--size", choices=list(SIZES), default="medium")
+    parser.add_argument("--users", type=int, help="Overrides the preset")
+    parser.add_argument("--recipes", type=int, help="Overrides the preset")
+    parser.add_argument("--equipment", type=int, default=len(EQUIPMENT), help="Equipment vocabulary size")
+    parser.add_argument("--products", type=int, default=len(PRODUCTS), help="Product vocabulary size")
+    parser.add_argument("--interactions-per-user", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="Defaults to synthetic/<size>")
+    args = parser.parse_args()
+
+    n_users, n_recipes = SIZES[args.size]
+    dataset = SyntheticDataset(args.users or n_users, args.recipes or n_recipes, args.equipment, args.products,
+                               args.interactions_per_user, seed=args.seed)
+    out_dir = args.out or SYNTHETIC_DIR / args.size
+    params = dataset.write(out_dir)
+    print(f"{params['n_users']} users, {params['n_recipes']} recipes and {params['n_interactions']} interactions "
+          f"written to {out_dir} in {params['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
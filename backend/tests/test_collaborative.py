@@ -0,0 +1,55 @@
+import numpy as np
+from collaborative import CollaborativeEngine, fit_factors, rating_totals
+from interning import Interner
+
+
+def fitted(tmp_path, n_users=40, n_recipes=25):
+    rng = np.random.default_rng(0)
+    rows, cols = rng.integers(0, n_users, 500), rng.integers(0, n_recipes, 500)
+    ratings = rng.integers(1, 6, 500).astype(np.float32)
+    sums, counts = rating_totals(rows, cols, ratings, (n_users, n_recipes))
+    history = (sums.indptr, sums.indices, sums.data.copy(), counts.data)
+    sums.data /= counts.data
+    user_factors, item_factors = fit_factors(sums, 4)
+    recipe_ids = Interner(f"r{i}" for i in range(n_recipes))
+    path = tmp_path / "factors.npz"
+    CollaborativeEngine([f"u{i}" for i in range(n_users)], user_factors, item_factors, recipe_ids,
+                        feasibility_index=None, history=history).save(path)
+    return path, recipe_ids, user_factors
+
+
+def test_fold_in_keeps_fitted_history(tmp_path):
+    path, recipe_ids, user_factors = fitted(tmp_path)
+    engine = CollaborativeEngine.load(path, recipe_ids, None)
+    np.testing.assert_allclose(engine.fold_in("u3", [], []), user_factors[3], atol=1e-5)
+    assert not np.allclose(engine.fold_in("u3", ["r1"], [5]), engine.fold_in("new", ["r1"], [5]))
+
+
+def test_fold_ins_are_replayed_on_load(tmp_path):
+    path, recipe_ids, _ = fitted(tmp_path)
+    log = tmp_path / "foldins.jsonl"
+    engine = CollaborativeEngine.load(path, recipe_ids, None, foldin_log=log)
+    engine.fold_in("u3", ["r1", "r2"], [5, 4])
+    factors = engine.fold_in("new", ["r1"], [3])
+
+    reloaded = CollaborativeEngine.load(path, recipe_ids, None, foldin_log=log)
+    np.testing.assert_array_equal(reloaded.user_factors[reloaded.index["new"]], factors)
+    np.testing.assert_array_equal(reloaded.user_factors[reloaded.index["u3"]],
+                                  engine.user_factors[engine.index["u3"]])
+    assert len(log.read_text().splitlines()) == 2
+
+
+def test_replay_compacts_log_to_one_line_per_user(tmp_path):
+    path, recipe_ids, _ = fitted(tmp_path)
+    log = tmp_path / "foldins.jsonl"
+    engine = CollaborativeEngine.load(path, recipe_ids, None, foldin_log=log)
+    for i in range(3):
+        engine.fold_in("new", [f"r{i}"], [4])
+    for i in range(2000):
+        engine.fold_in(f"user_{i}", ["r1"], [5])
+
+    reloaded = CollaborativeEngine.load(path, recipe_ids, None, foldin_log=log)
+    assert len(log.read_text().splitlines()) == 2001
+    np.testing.assert_array_equal(reloaded.user_factors[reloaded.index["new"]],
+                                  engine.user_factors[engine.index["new"]])
+    assert len(reloaded.user_ids) == 40 + 2001
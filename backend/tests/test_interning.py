@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from interning import Interner, SortedIds, sort_ids
+
+
+def test_encode_and_decode():
+    interner = Interner(["b", "a", "c"])
+    assert interner.encode(pd.Series(["c", "x", "b"])).tolist() == [2, -1, 0]
+    assert interner.encode([]).dtype == np.int32
+    assert interner.decode([1, 0]).tolist() == ["a", "b"]
+    assert len(interner) == 3 and list(interner) == ["b", "a", "c"]
+
+
+def test_duplicates_resolve_to_last_occurrence():
+    interner = Interner(["a", "b", "a", "c", "b"])
+    assert interner.code("a") == 2
+    assert interner.code("b") == 4
+    assert interner.encode(["a", "b", "c", "z"]).tolist() == [2, 4, 3, -1]
+    assert len(interner) == 5
+
+
+def test_code_of_unknown_or_unhashable_is_none():
+    interner = Interner(["a"])
+    assert interner.code("z") is None
+    assert interner.code(["a"]) is None
+    assert "a" in interner and "z" not in interner
+
+
+def test_sorted_ids_match_interner():
+    ids = ["user_10", "user_2", "user_10", "user_1"]
+    table = [user_id.encode() for user_id in ids]
+    sorted_ids, sorted_rows = sort_ids(np.array(table, dtype=np.bytes_))
+    mapped = SortedIds(table, sorted_ids, sorted_rows)
+    interner = Interner(ids)
+    queries = ids + ["user_3", "", "user_100000000000"]
+    for user_id in queries:
+        assert mapped.code(user_id) == interner.code(user_id)
+    assert mapped.encode(queries).tolist() == interner.encode(queries).tolist()
+    assert mapped.encode([]).dtype == np.int32
+    assert mapped[1] == "user_2" and mapped[1:3] == ["user_2", "user_10"]
@@ -0,0 +1,11 @@
+from pathlib import Path
+import pytest
+from numpy_engine import check_parity
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def test_numpy_towers_match_torch_on_shipped_weights():
+    pytest.importorskip("torch")
+    error = check_parity(BACKEND_DIR / 'model_weights.pth', BACKEND_DIR / 'model_weights.npz')
+    assert error < 1e-5
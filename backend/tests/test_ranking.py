@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from feasibility import FeasibilityIndex
+from ranking import top_k_feasible, top_k_feasible_batch
+
+
+def test_top_k_returns_best_feasible_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    feasible = np.array([True, False, True, True, True])
+    indices, top_scores = top_k_feasible(scores, feasible, 3)
+    assert indices.tolist() == [3, 2, 4]
+    assert top_scores.tolist() == [0.7, 0.5, 0.3]
+
+
+def test_top_k_with_non_positive_k_is_empty():
+    scores = np.array([[0.1, 0.2], [0.3, 0.4]])
+    feasible = np.ones_like(scores, dtype=bool)
+    for k in (0, -3):
+        for indices, top_scores in top_k_feasible_batch(scores, feasible, [k, k]):
+            assert len(indices) == 0 and len(top_scores) == 0
+
+
+def test_top_k_larger_than_feasible_returns_only_feasible():
+    scores = np.array([[0.4, 0.3, 0.2, 0.1], [0.1, 0.2, 0.3, 0.4]])
+    feasible = np.array([[True, False, True, False], [False, False, False, False]])
+    (first, first_scores), (second, _) = top_k_feasible_batch(scores, feasible, [10, 10])
+    assert first.tolist() == [0, 2]
+    assert np.isfinite(first_scores).all()
+    assert len(second) == 0
+
+
+def test_mixed_ks_in_one_batch():
+    scores = np.tile(np.arange(6, dtype=np.float64), (3, 1))
+    feasible = np.ones_like(scores, dtype=bool)
+    results = top_k_feasible_batch(scores, feasible, [1, 0, 6])
+    assert [indices.tolist() for indices, _ in results] == [[5], [], [5, 4, 3, 2, 1, 0]]
+
+
+def test_feasibility_requires_all_equipment_and_products():
+    recipes = pd.DataFrame({
+        "required_equipment": ["['grinder']", "['grinder', 'kettle']", "[]"],
+        "required_products": ["{'beans': '18g'}", "{}", "{'milk': '100ml'}"],
+    })
+    index = FeasibilityIndex.from_recipes(recipes)
+    assert index.feasible(index.encode({'beans': 1}, ['grinder'])).tolist() == [True, False, False]
+    assert index.feasible(index.encode([], [])).tolist() == [False, False, False]
+    # Unknown tokens have no bit and change nothing.
+    assert index.feasible(index.encode(['milk', 'sugar'], ['kettle', 'scale'])).tolist() == [False, False, True]
+    masks = np.stack([index.encode(['beans', 'milk'], ['grinder', 'kettle']), index.encode([], ['grinder'])])
+    assert index.feasible_batch(masks).tolist() == [[True, True, True], [False, False, False]]
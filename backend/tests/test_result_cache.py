@@ -0,0 +1,86 @@
+import numpy as np
+from result_cache import ResultCache, CachedRanker
+
+
+def ranking(n):
+    return np.arange(n, dtype=np.int64), np.linspace(1, 0, n, dtype=np.float32)
+
+
+def entry_size(n):
+    indices, scores = ranking(n)
+    return indices.nbytes + scores.nbytes + len(b"state") + ResultCache.ENTRY_OVERHEAD
+
+
+def test_hit_for_same_or_smaller_k():
+    cache = ResultCache(1 << 20)
+    cache.put(("r", "u"), "v1", b"state", 5, ranking(5))
+    indices, _ = cache.get(("r", "u"), "v1", b"state", 3)
+    assert indices.tolist() == [0, 1, 2]
+    assert cache.get(("r", "u"), "v1", b"state", 6) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_short_ranking_answers_larger_k():
+    cache = ResultCache(1 << 20)
+    # Only 2 feasible recipes for k=5, so every larger k has the same answer.
+    cache.put(("r", "u"), "v1", b"state", 5, ranking(2))
+    assert cache.get(("r", "u"), "v1", b"state", 50) is not None
+
+
+def test_evicts_least_recently_used_within_byte_bound():
+    cache = ResultCache(2 * entry_size(5))
+    cache.put(("r", "a"), "v1", b"state", 5, ranking(5))
+    cache.put(("r", "b"), "v1", b"state", 5, ranking(5))
+    cache.get(("r", "a"), "v1", b"state", 5)
+    cache.put(("r", "c"), "v1", b"state", 5, ranking(5))
+    assert cache.get(("r", "b"), "v1", b"state", 5) is None
+    assert cache.get(("r", "a"), "v1", b"state", 5) is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] <= stats["max_bytes"]
+
+
+def test_entries_larger_than_the_cache_are_not_stored():
+    cache = ResultCache(entry_size(5) - 1)
+    cache.put(("r", "a"), "v1", b"state", 5, ranking(5))
+    assert cache.stats()["entries"] == 0
+
+
+def test_version_or_state_change_invalidates():
+    cache = ResultCache(1 << 20)
+    cache.put(("r", "u"), "v1", b"state", 5, ranking(5))
+    assert cache.get(("r", "u"), "v2", b"state", 5) is None
+    cache.put(("r", "u"), "v1", b"state", 5, ranking(5))
+    assert cache.get(("r", "u"), "v1", b"other", 5) is None
+    assert cache.stats()["invalidations"] == 2 and cache.stats()["entries"] == 0
+
+
+def test_invalidate_drops_user_for_every_ranker():
+    cache = ResultCache(1 << 20)
+    for ranker in ("a", "b"):
+        cache.put((ranker, "u"), "v1", b"state", 5, ranking(5))
+    cache.put(("a", "other"), "v1", b"state", 5, ranking(5))
+    cache.invalidate("u")
+    assert cache.stats()["entries"] == 1
+    assert cache.get(("a", "other"), "v1", b"state", 5) is not None
+
+
+def test_cached_ranker_ranks_only_misses():
+    class Store:
+        user_ids = ["u0", "u1"]
+        taste = np.zeros((2, 4), dtype=np.float32)
+        strength = np.zeros(2, dtype=np.float32)
+        masks = np.zeros((2, 1), dtype=np.uint64)
+
+    class Ranker:
+        calls = []
+
+        def rank(self, user_store, rows, ks):
+            self.calls.append(list(rows))
+            return [ranking(k) for k in ks]
+
+    inner = Ranker()
+    ranker = CachedRanker(ResultCache(1 << 20), "r", "v1", inner)
+    ranker.rank(Store, [0], [3])
+    results = ranker.rank(Store, [0, 1], [3, 3])
+    assert inner.calls == [[0], [1]]
+    assert [indices.tolist() for indices, _ in results] == [[0, 1, 2], [0, 1, 2]]
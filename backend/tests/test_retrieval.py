@@ -0,0 +1,36 @@
+import numpy as np
+from feasibility import FeasibilityIndex
+from retrieval import ExactRetriever, IVFIndex, recall_report
+
+
+def catalog(n_items=2000, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    embeddings = (centers[rng.integers(0, 20, n_items)] + 0.3 * rng.normal(size=(n_items, dim))).astype(np.float32)
+    index = FeasibilityIndex(["grinder", "kettle"], ["milk"])
+    requirements = [([], []), ([], ["grinder"]), (["milk"], ["kettle"])]
+    index.recipe_masks = np.stack([index.encode(*requirements[i % 3]) for i in range(n_items)])
+    return embeddings, index
+
+
+def test_ivf_recall_against_exact():
+    embeddings, index = catalog()
+    rng = np.random.default_rng(1)
+    queries = rng.normal(size=(200, embeddings.shape[1])).astype(np.float32)
+    user_masks = np.stack([index.encode(["milk"], ["kettle"]) if i % 2 else index.encode([], []) for i in range(200)])
+    ivf = IVFIndex(embeddings, index, n_lists=32, nprobe=4)
+    report = {row["nprobe"]: row["recall"] for row in
+              recall_report(ivf, ExactRetriever(embeddings, index), queries, user_masks, k=10, nprobes=(4, 32))}
+    assert report[4] >= 0.8
+    assert report[32] == 1.0
+
+
+def test_ivf_returns_only_feasible_and_enough_results():
+    embeddings, index = catalog()
+    ivf = IVFIndex(embeddings, index, n_lists=32, nprobe=1)
+    user_mask = index.encode([], ["grinder"])
+    feasible = index.feasible(user_mask)
+    indices, scores = ivf.search_batch(embeddings[:1], user_mask[None, :], [25])[0]
+    assert len(indices) == 25
+    assert feasible[indices].all()
+    assert (np.diff(scores) <= 0).all()
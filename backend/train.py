@@ -0,0 +1,267 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from pathlib import Path
+from twotower import TwoTowerModel
+from user_store import TASTE_COLUMNS
+from content_based import RECIPE_FEATURES
+from snapshot import DEFAULT_SOURCES
+from interning import Interner
+import config
+
+BASE_DIR = Path(__file__).resolve().parent
+CHECKPOINT = BASE_DIR / '../checkpoints/train.pt'
+# Trained weights land here unless --install asks to replace the served model.
+WEIGHTS_OUT = BASE_DIR / '../checkpoints/model_weights.pth'
+
+
+class InteractionStream:
+    """
+    Reads interaction files in chunks and yields (user rows, recipe rows,
+    weights) index batches. Ids are interned with a vectorized
+    Interner.encode and batches are slices of shuffled chunk arrays, so
+    there is no per-row Python.
+    """
+
+    def __init__(self, paths, user_ids, recipe_ids, batch_size=1024, chunk_size=1_000_000):
+        self.paths = [Path(path) for path in paths]
+        self.user_ids = Interner(user_ids)
+        self.recipe_ids = Interner(recipe_ids)
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        for path in self.paths:
+            for chunk in pd.read_csv(path, usecols=['user_id', 'recipe_id', 'rating'], chunksize=self.chunk_size):
+                users = self.user_ids.encode(chunk['user_id'])
+                recipes = self.recipe_ids.encode(chunk['recipe_id'])
+                weights = chunk['rating'].fillna(2.5).to_numpy(dtype=np.float32) / 5.0
+                known = (users >= 0) & (recipes >= 0)
+                yield users[known], recipes[known], weights[known]
+
+    def batches(self, rng, skip_chunks=0):
+        """
+        Yields (chunk number, users, recipes, weights); the first
+        skip_chunks chunks are read but not trained on, for resuming.
+        """
+        for chunk_number, (users, recipes, weights) in enumerate(self.chunks()):
+            order = rng.permutation(len(users))
+            if chunk_number < skip_chunks:
+                continue
+            users, recipes, weights = users[order], recipes[order], weights[order]
+            for start in range(0, len(users), self.batch_size):
+                end = start + self.batch_size
+                yield chunk_number, users[start:end], recipes[start:end], weights[start:end]
+
+
+def recipe_log_frequency(stream, n_recipes):
+    """
+    log of each recipe's share of the training interactions, used to
+    correct in-batch negatives for popularity (logQ correction).
+    """
+    counts = np.zeros(n_recipes)
+    for _, recipes, _ in stream.chunks():
+        counts += np.bincount(recipes, minlength=n_recipes)
+    return np.log(np.maximum(counts, 1) / max(counts.sum(), 1)).astype(np.float32)
+
+
+def in_batch_softmax_loss(user_embs, item_embs, recipes, weights, log_q=None, temperature=0.1):
+    """
+    Sampled softmax where the other positives of the batch are the
+    negatives. Copies of the positive recipe elsewhere in the batch are
+    masked out so they are not counted as negatives.
+    """
+    logits = user_embs @ item_embs.T / temperature
+    if log_q is not None:
+        logits = logits - log_q[recipes][None, :]
+    same_recipe = recipes[:, None] == recipes[None, :]
+    same_recipe.fill_diagonal_(False)
+    logits = logits.masked_fill(same_recipe, float('-inf'))
+    targets = torch.arange(len(recipes))
+    return (F.cross_entropy(logits, targets, reduction='none') * weights).sum() / weights.sum()
+
+
+def save_checkpoint(path, model, optimizer, epoch, chunk, step, rng):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    torch.save({
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "epoch": epoch,
+        "chunk": chunk,
+        "step": step,
+        "rng": rng.bit_generator.state,
+        "torch_rng": torch.get_rng_state(),
+    }, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_weights(model, path):
+    """
+    Writes the state dict load_torch_model() reads, replacing the file
+    atomically so a watching server never loads a partial file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+
+class Validator:
+    """
+    NDCG@k of the model being trained on the held-out validation files,
+    computed by evaluation.py on the NumPy forward pass.
+    """
+
+    def __init__(self, recipes_df, val_paths, k=5):
+        from evaluation import EvaluationData
+
+        self.data = EvaluationData()
+        self.recipes_df = recipes_df
+        self.val_paths = [Path(path) for path in val_paths if Path(path).exists()]
+        self.k = k
+
+    def __call__(self, model):
+        from evaluation import evaluate
+        from numpy_engine import NumpyTwoTowerModel
+        from load_data import load_recipe_embeddings
+        from retrieval import ExactRetriever
+
+        state_dict = {name: tensor.detach().numpy() for name, tensor in model.state_dict().items()}
+        self.data.model = NumpyTwoTowerModel.from_state_dict(state_dict)
+        self.data.retriever = ExactRetriever(load_recipe_embeddings(self.data.model, self.recipes_df), self.data.feasibility_index)
+        return {
+            path.name: evaluate(self.data, path, ["two_tower"], self.k)["two_tower"][f"ndcg@{self.k}"]
+            for path in self.val_paths
+        }
+
+
+def train(args):
+    from load_data import load_df
+
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    users_df, recipes_df = load_df()
+    validator = Validator(recipes_df, args.val, args.k) if args.val else None
+    user_features = torch.from_numpy(users_df[TASTE_COLUMNS].to_numpy(dtype=np.float32))
+    item_features = torch.from_numpy(recipes_df[RECIPE_FEATURES].to_numpy(dtype=np.float32))
+    stream = InteractionStream(args.train, users_df['user_id'].astype(str), recipes_df['recipe_id'].astype(str),
+                               args.batch_size, args.chunk_size)
+    log_q = torch.from_numpy(recipe_log_frequency(stream, len(recipes_df))) if args.logq else None
+
+    model = TwoTowerModel(user_dim=4, item_dim=4, embedding_dim=32)
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+    start_epoch, skip_chunks, step = 0, 0, 0
+    if args.resume and args.checkpoint.exists():
+        state = torch.load(args.checkpoint, map_location='cpu')
+        model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        start_epoch, skip_chunks, step = state["epoch"], state["chunk"], state["step"]
+        rng.bit_generator.state = state["rng"]
+        torch.set_rng_state(state["torch_rng"])
+        print(f"Resumed from {args.checkpoint} at epoch {start_epoch}, chunk {skip_chunks}, step {step}")
+
+    deadline = time.monotonic() + args.max_minutes * 60 if args.max_minutes else None
+    last_checkpoint = time.monotonic()
+    for epoch in range(start_epoch, args.epochs):
+        model.train()
+        epoch_start, samples, loss_sum, n_batches = time.perf_counter(), 0, 0.0, 0
+        # The rng state at the start of the epoch makes resumed chunk shuffles identical.
+        epoch_rng_state = rng.bit_generator.state
+        chunk = skip_chunks
+        for chunk, users, recipes, weights in stream.batches(rng, skip_chunks):
+            users, recipes = torch.from_numpy(users), torch.from_numpy(recipes)
+            user_embs = model.user_mlp(user_features[users])
+            item_embs = model.item_mlp(item_features[recipes])
+            loss = in_batch_softmax_loss(user_embs, item_embs, recipes, torch.from_numpy(weights), log_q, args.temperature)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            step += 1
+            samples += len(users)
+            loss_sum += loss.item()
+            n_batches += 1
+
+            if step % args.log_every == 0:
+                elapsed = time.perf_counter() - epoch_start
+                print(f"epoch {epoch} step {step} loss {loss_sum / n_batches:.4f} {samples / elapsed:.0f} samples/s", flush=True)
+            if time.monotonic() - last_checkpoint >= args.checkpoint_minutes * 60:
+                # Resuming restarts from the beginning of the chunk being trained on.
+                rng_state = rng.bit_generator.state
+                rng.bit_generator.state = epoch_rng_state
+                save_checkpoint(args.checkpoint, model, optimizer, epoch, chunk, step, rng)
+                rng.bit_generator.state = rng_state
+                last_checkpoint = time.monotonic()
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+        elapsed = time.perf_counter() - epoch_start
+        print(f"epoch {epoch} done: loss {loss_sum / max(n_batches, 1):.4f}, {samples} samples in {elapsed:.1f}s "
+              f"({samples / max(elapsed, 1e-9):.0f} samples/s, {args.threads} threads)")
+        skip_chunks = 0
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"Time budget of {args.max_minutes} minutes reached")
+            rng.bit_generator.state = epoch_rng_state
+            save_checkpoint(args.checkpoint, model, optimizer, epoch, chunk, step, rng)
+            break
+        save_checkpoint(args.checkpoint, model, optimizer, epoch + 1, 0, step, rng)
+
+        if validator is not None:
+            scores = validator(model)
+            print("  " + "  ".join(f"{name} ndcg@{args.k}={value:.4f}" for name, value in scores.items()))
+
+    save_weights(model, args.out)
+    print(f"Weights written to {args.out}")
+    if args.export_numpy:
+        from numpy_engine import export_weights
+        export_weights(args.out, args.numpy_out)
+        print(f"NumPy weights written to {args.numpy_out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the two-tower model on interaction logs with in-batch negatives.")
+    parser.add_argument("--train", nargs="+", default=[config.DATA_DIR / 'interactions_train.csv'])
+    parser.add_argument("--val", nargs="*", default=sorted(config.DATA_DIR.glob('interactions_val*.csv')))
+    parser.add_argument("--out", type=Path, help=f"Where to write the weights (default {WEIGHTS_OUT})")
+    parser.add_argument("--install", action="store_true",
+                        help="Overwrite the served weights (backend/model_weights.pth, and RRS_NUMPY_WEIGHTS with --export-numpy)")
+    parser.add_argument("--export-numpy", action="store_true", help="Also export the weights for RRS_ENGINE=numpy")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Rows read from the CSVs at a time")
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--temperature", type=float, default=0.1)
+    parser.add_argument("--no-logq", dest="logq", action="store_false", help="Disable the popularity correction")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT)
+    parser.add_argument("--checkpoint-minutes", type=float, default=5.0)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--max-minutes", type=float, help="Stop, checkpoint and write weights after this long")
+    parser.add_argument("--log-every", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.install:
+        if args.out is not None:
+            parser.error("--out and --install are mutually exclusive")
+        args.out, args.numpy_out = DEFAULT_SOURCES["model"], config.NUMPY_WEIGHTS
+    else:
+        args.out = args.out or WEIGHTS_OUT
+        args.numpy_out = args.out.with_suffix('.npz')
+    missing = [path for path in args.train if not Path(path).exists()]
+    if missing:
+        parser.error(f"Training interactions not found: {', '.join(map(str, missing))}")
+    train(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import numpy as np
+from recommendations import parse_json_column
+from interning import Interner, SortedIds
+
+TASTE_COLUMNS = ['taste_pref_bitterness', 'taste_pref_sweetness', 'taste_pref_acidity', 'taste_pref_body']
+JSON_COLUMNS = ['owned_equipment', 'available_products', 'dietary_restrictions']
+
+
+class UserStore:
+    """
+    Pre-encoded user features: user ids interned to their row offsets,
+    a contiguous float32 taste matrix and feasibility masks encoded with
+    the recipe vocabulary of a FeasibilityIndex, plus the preferred
+    strength used by the content-based ranker.
+    """
+
+    def __init__(self, user_ids, taste, strength, masks, profiles):
+        self.user_ids = user_ids if isinstance(user_ids, (Interner, SortedIds)) else Interner(user_ids)
+        self.taste = np.ascontiguousarray(taste, dtype=np.float32)
+        self.strength = np.asarray(strength, dtype=np.float32)
+        self.masks = masks
+        self.profiles = profiles
+
+    @classmethod
+    def from_users_df(cls, users_df, feasibility_index):
+        user_ids = users_df['user_id'].astype(str).tolist()
+        taste = users_df[TASTE_COLUMNS].to_numpy(dtype=np.float32)
+        strength = users_df['preferred_strength'].to_numpy(dtype=np.float32)
+
+        profiles = users_df.to_dict('records')
+        masks = np.zeros((len(profiles), feasibility_index.n_words), dtype=np.uint64)
+        for row, profile in enumerate(profiles):
+            for column in JSON_COLUMNS:
+                profile[column] = parse_json_column(profile[column])
+            masks[row] = feasibility_index.encode(profile['available_products'], profile['owned_equipment'])
+
+        return cls(user_ids, taste, strength, masks, profiles)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def lookup(self, user_id):
+        return self.user_ids.code(str(user_id))